@@ -0,0 +1,71 @@
+"""
+Import time of the correction core and of the command line
+
+Run from the repository root: python -m benchmarks.bench_import
+
+Every module is imported in a fresh interpreter with `-X importtime`
+and the best cumulative time of the repeats is compared with its budget.
+The core must not load pandas or matplotlib at all, they are imported
+on the first use of a DataFrame adapter or a plot. Exits with status 1
+if a budget is exceeded or a heavy package is loaded.
+"""
+import argparse
+import subprocess
+import sys
+
+# Budgets in ms. On the reference machine numpy alone takes ~80 ms,
+# pandas ~300 ms and matplotlib.pyplot ~550 ms
+BUDGETS = {'src.functions.streaming': 100,
+           'src.functions.vectorized': 200,
+           'src.functions.fleet': 200,
+           'src.functions.stationary': 200,
+           'src.cli': 300}
+# Packages the modules must not import
+HEAVY = ('pandas', 'matplotlib')
+# Measured for reference only
+REFERENCE = ('numpy', 'pandas', 'matplotlib.pyplot')
+
+
+def import_time(module: str) -> tuple[float, list[str]]:
+    """
+    Imports the module in a new interpreter, returns cumulative import
+    time in ms and the heavy packages it loaded
+    """
+
+    code = (f'import sys, {module}; '
+            f'print(*(m for m in {HEAVY!r} if m in sys.modules))')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            capture_output=True, text=True, check=True)
+
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        _, cumulative, name = line.rsplit('|', 2)
+        if name.strip() == module:
+            return int(cumulative) / 1000, result.stdout.split()
+    raise RuntimeError(f'{module} is missing in the import times')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    print(f'{"module":<28}{"ms":>8}{"budget":>8}  heavy')
+    for module in (*BUDGETS, *REFERENCE):
+        runs = [import_time(module) for _ in range(args.repeat)]
+        ms, heavy = min(runs)
+        budget = BUDGETS.get(module)
+        if budget is None:
+            print(f'{module:<28}{ms:>8.1f}{"-":>8}')
+            continue
+        over = ms > budget or bool(heavy)
+        failed |= over
+        print(f'{module:<28}{ms:>8.1f}{budget:>8}  '
+              f'{", ".join(heavy) or "-"}{"  OVER" if over else ""}')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""
+Benchmarks of the correction pipeline on synthetic tracks
+
+Run from the repository root:
+    python -m benchmarks.bench_pipeline run --sizes 1e3 1e4 1e5 1e6
+    python -m benchmarks.bench_pipeline compare old.json new.json
+
+Every case records throughput (fixes/s) and peak memory traced by
+tracemalloc. Results are stored as JSON together with versions and
+the git commit, so runs of different versions can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from src.cli import legacy_frame
+from src.data.chunked import correct_csv_chunked, read_corrected_csv
+from src.data.make_dataset import DataSet, ColumnarDataSet, make_new_df
+from src.data.synthetic import make_track
+from src.functions.functions import transfrom
+from src.functions.parallel import transfrom_parallel
+from src.functions.vectorized import transfrom_batch
+
+
+def measure(case, repeat: int) -> dict:
+    """
+    Runs `case()` `repeat` times for the best time and once more
+    under tracemalloc for peak memory. `case` returns number of fixes
+    """
+
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = case()
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    case()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    best = min(seconds)
+    return {'rows': rows,
+            'seconds': best,
+            'fixes_per_s': rows / best if best > 0 else None,
+            'peak_mb': peak / 2**20}
+
+
+def make_cases(df: pd.DataFrame, tmp_dir: str, rows_limit: int) -> dict:
+    """
+    Returns benchmark cases for the track
+    """
+
+    n = len(df)
+    in_path = os.path.join(tmp_dir, 'track.csv')
+    out_path = os.path.join(tmp_dir, 'track_new.csv')
+    df.to_csv(in_path, index=False)
+
+    dataset = DataSet()
+    transfrom_batch(df, dataset)
+    columnar = ColumnarDataSet()
+    transfrom_batch(df, columnar)
+
+    def run(engine, storage, recalc):
+        def case():
+            engine(df, storage(), recalc=recalc)
+            return n
+        return case
+
+    def make_df(source):
+        def case():
+            make_new_df(source)
+            return n
+        return case
+
+    def csv_legacy():
+        legacy_frame(dataset).to_csv(out_path, index=False)
+        pd.read_csv(out_path)
+        return n
+
+    def csv_chunked():
+        correct_csv_chunked(in_path, out_path, chunksize=100_000)
+        read_corrected_csv(out_path)
+        return n
+
+    cases = {}
+    if n <= rows_limit:
+        cases['transfrom recalc'] = run(transfrom, DataSet, True)
+        cases['transfrom no recalc'] = run(transfrom, DataSet, False)
+    cases['batch recalc'] = run(transfrom_batch, DataSet, True)
+    cases['batch no recalc'] = run(transfrom_batch, DataSet, False)
+    cases['batch columnar'] = run(transfrom_batch, ColumnarDataSet, True)
+    cases['parallel recalc'] = run(transfrom_parallel, DataSet, True)
+    cases['make_new_df'] = make_df(dataset)
+    cases['make_new_df columnar'] = make_df(columnar)
+    cases['csv round-trip legacy'] = csv_legacy
+    cases['csv chunked correct+read'] = csv_chunked
+
+    return cases
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {'commit': commit,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor()}
+
+
+def run_benchmarks(args: argparse.Namespace) -> None:
+    results = {'environment': environment(), 'results': []}
+
+    for size in args.sizes:
+        df = make_track(int(size), seed=args.seed)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name, case in make_cases(df, tmp_dir, args.rows_limit).items():
+                result = measure(case, args.repeat)
+                result['case'] = name
+                results['results'].append(result)
+                print(f'{name:<24}{len(df):>10}{result["seconds"]:>10.3f} s'
+                      f'{result["fixes_per_s"]:>14,.0f} fixes/s'
+                      f'{result["peak_mb"]:>10.1f} MB')
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f'Saved to {args.output}')
+
+
+def compare(args: argparse.Namespace) -> None:
+    """
+    Prints change of throughput and memory between two result files
+    """
+
+    def load(path):
+        with open(path) as file:
+            data = json.load(file)
+        return data['environment'], {(r['case'], r['rows']): r
+                                     for r in data['results']}
+
+    old_env, old = load(args.old)
+    new_env, new = load(args.new)
+    print(f'{old_env["commit"]} -> {new_env["commit"]}')
+
+    for key in sorted(old.keys() & new.keys(), key=lambda k: (k[1], k[0])):
+        speed = new[key]['fixes_per_s'] / old[key]['fixes_per_s']
+        memory = new[key]['peak_mb'] - old[key]['peak_mb']
+        flag = '  REGRESSION' if speed < 1 - args.threshold else ''
+        print(f'{key[0]:<24}{key[1]:>10}{speed:>8.2f}x speed'
+              f'{memory:>+10.1f} MB{flag}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='run benchmarks')
+    run.add_argument('--sizes', type=float, nargs='+',
+                     default=[1e3, 1e4, 1e5, 1e6])
+    run.add_argument('--repeat', type=int, default=3)
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('--rows-limit', type=float, default=1e4,
+                     help='largest track for the per-row transfrom')
+    run.add_argument('-o', '--output',
+                     default=os.path.join('benchmarks', 'results',
+                                          'pipeline.json'))
+    run.set_defaults(func=run_benchmarks)
+
+    cmp = commands.add_parser('compare', help='compare two result files')
+    cmp.add_argument('old')
+    cmp.add_argument('new')
+    cmp.add_argument('--threshold', type=float, default=0.1,
+                     help='relative slowdown reported as regression')
+    cmp.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Compares ShiftTable lookups with `caluclate_shifts` calculated
+by NumPy ufuncs and, for single fixes, by the `math` kernel which
+`caluclate_shifts` dispatches Python floats to (`scalar.caluclate_shifts`)
+
+Run from the repository root: python -m benchmarks.bench_shift_table
+"""
+import argparse
+import timeit
+
+import numpy as np
+from src.functions import scalar
+from src.functions.functions import caluclate_shifts, calculate_backroll
+from src.functions.shift_table import ShiftTable
+
+
+def make_angles(n: int, seed: int = 0) -> tuple[list, list]:
+    """
+    Returns roll and pitch quantized to 0.01 degree like in data/data.csv
+    """
+
+    rng = np.random.default_rng(seed)
+    roll = np.round(3.9 + rng.normal(0, 0.5, n), 2)
+    pitch = np.round(-1.2 + rng.normal(0, 0.5, n), 2)
+    return roll.tolist(), pitch.tolist()
+
+
+def scalar_ufunc(roll: list, pitch: list) -> None:
+    # 0-d arrays are not dispatched to the math kernel
+    for r, p in zip(roll, pitch):
+        caluclate_shifts(r, p)
+        calculate_backroll(r)
+
+
+def scalar_math(roll: list, pitch: list) -> None:
+    for r, p in zip(roll, pitch):
+        scalar.caluclate_shifts(r, p)
+        scalar.calculate_backroll(r)
+
+
+def scalar_table(table: ShiftTable, roll: list, pitch: list) -> None:
+    for r, p in zip(roll, pitch):
+        table.shift(r, p)
+        table.backroll(r)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', type=int, default=100_000,
+                        help='number of fixes')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    roll, pitch = make_angles(args.n)
+    roll_array, pitch_array = np.array(roll), np.array(pitch)
+    table = ShiftTable()
+
+    roll_0d = [np.asarray(r) for r in roll]
+    pitch_0d = [np.asarray(p) for p in pitch]
+
+    cases = {
+        'scalar ufunc': lambda: scalar_ufunc(roll_0d, pitch_0d),
+        'scalar math': lambda: scalar_math(roll, pitch),
+        'scalar table': lambda: scalar_table(table, roll, pitch),
+        'array ufunc': lambda: caluclate_shifts(roll_array, pitch_array),
+        'array table': lambda: table.shifts(roll_array, pitch_array),
+    }
+
+    times = {name: min(timeit.repeat(case, number=1, repeat=args.repeat))
+             for name, case in cases.items()}
+
+    # Speedup against the ufuncs and, for single fixes, against
+    # the math kernel used for Python floats
+    print(f'{"case":<14}{"ns/fix":>10}{"vs ufunc":>10}{"vs math":>10}')
+    for name, seconds in times.items():
+        kind = name.split()[0]
+        versus = [times[f'{kind} ufunc'] / seconds]
+        if kind == 'scalar':
+            versus.append(times['scalar math'] / seconds)
+        print(f'{name:<14}{seconds / args.n * 1e9:>10.1f}'
+              + ''.join(f'{ratio:>9.1f}x' for ratio in versus))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from src.data.make_dataset import DataSet, dataset_columns
+from src.functions.functions import transfrom
+from src.functions.parallel import transfrom_parallel
+from src.functions.vectorized import transfrom_batch
+from src.visualization.report import FIGURES, FORMATS, generate_report
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+ENGINES = {'batch': transfrom_batch,
+           'rows': transfrom,
+           'parallel': transfrom_parallel}
+
+
+def find_logs(patterns: list[str], suffix: str = '') -> list[Path]:
+    """
+    Expands directories and glob patterns into sorted list of csv files
+
+    Parameters
+    ----------
+    patterns: list[str]
+        Paths to files or directories, or glob patterns
+
+    suffix: str, optional
+        Suffix of corrected logs (see `output_path`). Files named with it
+        found in directories or by glob patterns, e.g. data_new.csv next
+        to data.csv, are outputs of an earlier run and are skipped.
+        Files given by their path are always kept
+
+    Returns
+    ----------
+    paths: list[Path]
+        Unique paths in sorted order
+    """
+
+    paths = set()
+
+    for pattern in patterns:
+        if os.path.isfile(pattern):
+            paths.add(Path(pattern))
+            continue
+        if os.path.isdir(pattern):
+            found = Path(pattern).glob('*.csv')
+        else:
+            found = map(Path, glob.glob(pattern))
+        paths.update(path for path in found
+                     if not (suffix and path.stem.endswith(suffix)))
+
+    return sorted(paths)
+
+
+def output_path(path: Path, out_dir: Path, suffix: str) -> Path:
+    """
+    Returns path of corrected log: data.csv -> out_dir/data_new.csv
+    """
+
+    return out_dir / f'{path.stem}{suffix}{path.suffix}'
+
+
+def journal_path(out_path: Path) -> Path:
+    """
+    Returns path of the journal of a run: out_dir/.data_new.csv.journal
+    """
+
+    return out_path.with_name(f'.{out_path.name}.journal')
+
+
+def legacy_frame(dataset: DataSet) -> 'pd.DataFrame':
+    """
+    Creates dataframe in the schema of data/data_new.csv
+    with angles and shifts as tuples of plain floats
+    """
+
+    import pandas as pd
+
+    columns = dataset_columns(dataset)
+
+    return pd.DataFrame(data={
+        'time_s': columns['time_s'],
+        'x_mm': columns['x_mm'],
+        'y_mm': columns['y_mm'],
+        'roll_deg': columns['roll_deg'],
+        'pitch_deg': columns['pitch_deg'],
+        'angle': list(zip(columns['angle_x'].tolist(),
+                          columns['angle_y'].tolist())),
+        'shift': list(zip(columns['shift_x'].tolist(),
+                          columns['shift_y'].tolist())),
+        'adj_x': columns['adj_x'],
+        'adj_y': columns['adj_y']})
+
+
+def correct_file(path: Path,
+                 out_path: Path,
+                 engine: str = 'batch',
+                 recalc: bool = True,
+                 recalc_window: int | None = None,
+                 chunksize: int | None = None,
+                 workers: int | None = None,
+                 journal: bool = False) -> tuple[int, float]:
+    """
+    Corrects a single log and writes the result. The output appears
+    only when it is completely written, so a crashed run never leaves
+    a partial file behind.
+
+    Parameters
+    ----------
+    path: Path
+        Initial log
+
+    out_path: Path
+        Corrected log
+
+    engine: str, default = 'batch'
+        'batch' for transfrom_batch, 'rows' for transfrom,
+        'parallel' for transfrom_parallel
+
+    recalc: bool, default = True
+        recalculate previous points' coordinates after
+        encountering points with the same roll
+
+    recalc_window: int, optional
+        Number of previous points to recalculate
+
+    chunksize: int, optional
+        Stream the log through `correct_csv_chunked` in chunks of this
+        size. The output then has numeric angle and shift columns
+
+    workers: int, optional
+        Number of processes for the 'parallel' engine
+
+    journal: bool, default = False
+        Keep the journal of the run next to the output (see
+        `correct_csv_journaled`), so a crashed run continues from its
+        last checkpoint. The output has numeric angle and shift columns
+
+    Returns
+    ----------
+    rows: int
+        Number of corrected fixes
+
+    seconds: float
+        Time spent on reading, correction and writing
+    """
+
+    import pandas as pd
+
+    start = time.perf_counter()
+
+    if journal:
+        from src.data.journal import correct_csv_journaled
+
+        dataset, state = correct_csv_journaled(
+            path, journal_path(out_path),
+            chunksize=chunksize or 100_000,
+            recalc=recalc,
+            recalc_window=recalc_window)
+        tmp_path = out_path.with_name(f'.{out_path.name}.tmp')
+        pd.DataFrame(dataset.columns(), copy=False).to_csv(tmp_path,
+                                                           index=False)
+        os.replace(tmp_path, out_path)
+        os.remove(journal_path(out_path))
+        return state.count, time.perf_counter() - start
+
+    if chunksize is not None:
+        from src.data.chunked import correct_csv_chunked
+
+        state = correct_csv_chunked(path, out_path,
+                                    chunksize=chunksize,
+                                    recalc=recalc,
+                                    recalc_window=recalc_window)
+        return state.count, time.perf_counter() - start
+
+    df = pd.read_csv(path)
+    dataset = DataSet()
+    kwargs = {'workers': workers} if engine == 'parallel' else {}
+    ENGINES[engine](df, dataset, recalc=recalc, recalc_window=recalc_window,
+                    **kwargs)
+
+    tmp_path = out_path.with_name(f'.{out_path.name}.tmp')
+    legacy_frame(dataset).to_csv(tmp_path, index=False)
+    os.replace(tmp_path, out_path)
+
+    return len(df), time.perf_counter() - start
+
+
+def run_correct(args: argparse.Namespace) -> int:
+    """
+    Corrects all logs in a process pool. Logs with existing output
+    are skipped unless --force is given, so an interrupted run resumes
+    where it stopped. With the 'parallel' engine logs are corrected
+    one after another, each on --jobs processes.
+    """
+
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    paths = find_logs(args.inputs, args.suffix)
+    if not paths:
+        raise SystemExit(f'No logs found in {" ".join(args.inputs)}')
+    out_paths = [output_path(path, out_dir, args.suffix) for path in paths]
+    if len(set(out_paths)) != len(out_paths):
+        raise SystemExit('Several inputs map to the same output file')
+
+    jobs = []
+    for path, out_path in zip(paths, out_paths):
+        if out_path.exists() and not args.force:
+            print(f'{path}: skipped, {out_path} exists')
+            continue
+        if args.force:
+            # A journal of an earlier run may have other settings
+            journal_path(out_path).unlink(missing_ok=True)
+        jobs.append((path, out_path))
+    names = [out_path for _, out_path in jobs]
+
+    total_rows, start = 0, time.perf_counter()
+
+    tasks = ([path for path, _ in jobs],
+             names,
+             [args.engine] * len(jobs),
+             [not args.no_recalc] * len(jobs),
+             [args.recalc_window] * len(jobs),
+             [args.chunksize] * len(jobs),
+             [args.jobs] * len(jobs),
+             [args.journal] * len(jobs))
+    # The parallel engine splits each log between the processes itself
+    pool = (None if (args.engine == 'parallel' and args.chunksize is None
+                     and not args.journal)
+            else ProcessPoolExecutor(max_workers=args.jobs))
+
+    try:
+        results = (map(correct_file, *tasks) if pool is None
+                   else pool.map(correct_file, *tasks))
+        # Results come in the order of inputs
+        for (path, out_path), (rows, seconds) in zip(jobs, results):
+            total_rows += rows
+            print(f'{path} -> {out_path}: {rows} fixes in {seconds:.3f} s '
+                  f'({rows / max(seconds, 1e-9):,.0f} fixes/s)')
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    seconds = time.perf_counter() - start
+    print(f'Total: {len(jobs)} files, {total_rows} fixes in {seconds:.3f} s '
+          f'({total_rows / max(seconds, 1e-9):,.0f} fixes/s)')
+
+    return 0
+
+
+def run_report(args: argparse.Namespace) -> int:
+    """
+    Renders QA figures of all logs in a process pool and prints
+    render time of every figure
+    """
+
+    paths = find_logs(args.inputs)
+    start = time.perf_counter()
+    timings = generate_report(paths, Path(args.out_dir),
+                              formats=tuple(args.format),
+                              dpi=args.dpi,
+                              workers=args.jobs,
+                              recalc=not args.no_recalc,
+                              recalc_window=args.recalc_window,
+                              smoothing=args.smoothing)
+
+    for log in timings:
+        print(f'{log["path"]}: {log["fixes"]} fixes corrected '
+              f'in {log["correct_s"]:.3f} s')
+        for name in FIGURES:
+            figure = log['figures'][name]
+            saved = ', '.join(f'{fmt} {figure[f"{fmt}_s"]:.3f} s'
+                              for fmt in args.format)
+            print(f'  {name}: drawn in {figure["draw_s"]:.3f} s, '
+                  f'saved {saved}')
+
+    seconds = time.perf_counter() - start
+    print(f'Total: {len(paths)} files, '
+          f'{len(paths) * len(FIGURES)} figures in {seconds:.3f} s')
+
+    return 0
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='python -m src',
+                                     description='GNSS tilt correction')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    correct = commands.add_parser('correct',
+                                  help='correct csv logs in parallel')
+    correct.add_argument('inputs', nargs='+',
+                         help='csv files, directories or glob patterns')
+    correct.add_argument('-o', '--out-dir', required=True,
+                         help='directory for corrected logs')
+    correct.add_argument('-j', '--jobs', type=int, default=None,
+                         help='number of worker processes')
+    correct.add_argument('--engine', choices=sorted(ENGINES),
+                         default='batch')
+    correct.add_argument('--no-recalc', action='store_true',
+                         help='do not recalculate previous points')
+    correct.add_argument('--recalc-window', type=int, default=None,
+                         help='number of previous points to recalculate')
+    correct.add_argument('--chunksize', type=int, default=None,
+                         help='read logs in chunks of this size and write '
+                              'numeric angle/shift columns')
+    correct.add_argument('--journal', action='store_true',
+                         help='journal the correction to disk, so a '
+                              'crashed run continues where it stopped '
+                              'on rerun')
+    correct.add_argument('--suffix', default='_new',
+                         help='suffix of output file names')
+    correct.add_argument('--force', action='store_true',
+                         help='overwrite existing outputs')
+    correct.set_defaults(func=run_correct)
+
+    report = commands.add_parser('report',
+                                 help='render QA figures of csv logs')
+    report.add_argument('inputs', nargs='+',
+                        help='csv files, directories or glob patterns')
+    report.add_argument('-o', '--out-dir', required=True,
+                        help='directory for figures and report.json')
+    report.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes')
+    report.add_argument('--format', nargs='+', choices=FORMATS,
+                        default=['png'], help='formats of figure files')
+    report.add_argument('--dpi', type=int, default=100)
+    report.add_argument('--no-recalc', action='store_true',
+                        help='do not recalculate previous points')
+    report.add_argument('--recalc-window', type=int, default=None,
+                        help='number of previous points to recalculate')
+    report.add_argument('--smoothing', type=int, default=None,
+                        help='window of moving average for headings')
+    report.set_defaults(func=run_report)
+
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = make_parser().parse_args(argv)
+    return args.func(args)
@@ -0,0 +1,176 @@
+import os
+
+import numpy as np
+import pandas as pd
+from src.data.make_dataset import ColumnarDataSet
+from src.functions.functions import calculate_backroll
+from src.functions.streaming import CorrectorState
+from src.functions.vectorized import (transfrom_arrays,
+                                      backward_kernel,
+                                      recalc_first,
+                                      adjust)
+
+INPUT_COLUMNS = ['time_s', 'x_mm', 'y_mm', 'roll_deg', 'pitch_deg']
+OUTPUT_COLUMNS = list(ColumnarDataSet.COLUMNS)
+
+
+def concat_columns(first: dict[str, np.ndarray],
+                   second: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+    """
+    Concatenates two dicts of columns
+    """
+
+    return {name: np.concatenate([first[name], second[name]])
+            for name in OUTPUT_COLUMNS}
+
+
+def slice_columns(columns: dict[str, np.ndarray],
+                  start: int,
+                  stop: int | None = None) -> dict[str, np.ndarray]:
+    """
+    Takes rows from start to stop of every column
+    """
+
+    return {name: columns[name][start:stop] for name in OUTPUT_COLUMNS}
+
+
+def write_columns(file, columns: dict[str, np.ndarray]) -> None:
+    """
+    Appends columns to an open csv file without header
+    """
+
+    if len(columns['time_s']):
+        pd.DataFrame(columns, columns=OUTPUT_COLUMNS,
+                     copy=False).to_csv(file, header=False, index=False)
+
+
+def correct_csv_chunked(in_path: str | os.PathLike,
+                        out_path: str | os.PathLike,
+                        chunksize: int = 100_000,
+                        recalc: bool = True,
+                        recalc_window: int | None = None) -> CorrectorState:
+    """
+    Corrects a log that does not fit into memory. The log is read in
+    chunks, the corrector state is carried from chunk to chunk and
+    corrected rows are written as soon as they can not change anymore.
+
+    While the points with the same roll have not been encountered, the
+    last `recalc_window` rows are held back, since the recalculation pass
+    may still update them. Without the window all rows before the first
+    pair of points with the same roll are held.
+
+    The output has numeric angle_x, angle_y, shift_x, shift_y columns
+    instead of stringified tuples of data/data_new.csv
+
+    Parameters
+    ----------
+    in_path: str or PathLike
+        Initial log with time_s, x_mm, y_mm, roll_deg, pitch_deg columns
+
+    out_path: str or PathLike
+        Corrected log. It appears only when it is completely written
+
+    chunksize: int, default = 100_000
+        Number of rows read at once
+
+    recalc: bool, default = True
+        recalculate previous points' coordinates after
+        encountering points with the same roll
+
+    recalc_window: int, optional
+        Number of previous points to recalculate. All points by default
+
+    Returns
+    ----------
+    state: CorrectorState
+        State of the corrector after the last row
+    """
+
+    state = CorrectorState()
+    # Rows which can still change and the index of the first of them
+    pending, start = None, 0
+
+    tmp_path = f'{out_path}.tmp'
+    with open(tmp_path, 'w', newline='') as file:
+        file.write(','.join(OUTPUT_COLUMNS) + '\n')
+
+        for chunk in pd.read_csv(in_path,
+                                 chunksize=chunksize,
+                                 usecols=INPUT_COLUMNS,
+                                 dtype=np.float64):
+            count = state.count
+            columns = transfrom_arrays(*(chunk[name]
+                                         for name in INPUT_COLUMNS),
+                                       recalc=False,
+                                       state=state)
+            changed = pending is not None
+            if pending is not None:
+                if count == 1:
+                    # Zero point gets the angle of the first one
+                    pending['angle_x'][-1] = columns['angle_x'][0]
+                columns = concat_columns(pending, columns)
+            else:
+                start = count
+
+            if recalc and state.anchor >= count:
+                first = recalc_first(state.anchor, recalc_window)
+                angles = columns['angle_x'].tolist()
+                backward_kernel(columns['x_mm'].tolist(),
+                                columns['y_mm'].tolist(),
+                                columns['shift_x'].tolist(),
+                                columns['shift_y'].tolist(),
+                                calculate_backroll(
+                                    columns['roll_deg']).tolist(),
+                                angles,
+                                state.anchor - start,
+                                max(first - start, 0))
+                columns['angle_x'] = np.array(angles, dtype=np.float64)
+                changed = True
+            if changed:
+                adjust(columns)
+
+            size = len(columns['time_s'])
+            if state.count < 2 or (recalc and state.flag
+                                   and recalc_window is None):
+                hold = size
+            elif recalc and state.flag:
+                hold = min(recalc_window, size)
+            else:
+                hold = 0
+
+            write_columns(file, slice_columns(columns, 0, size - hold))
+            pending = slice_columns(columns, size - hold) if hold else None
+            start += size - hold
+
+        if pending is not None:
+            write_columns(file, pending)
+
+    os.replace(tmp_path, out_path)
+
+    return state
+
+
+def read_corrected_csv(path: str | os.PathLike,
+                       chunksize: int | None = None):
+    """
+    Reads log written by `correct_csv_chunked`. All columns are float64,
+    so no parsing of tuples is needed. Values are parsed exactly, the
+    result can be compared with a batch correction bit for bit
+
+    Parameters
+    ----------
+    path: str or PathLike
+        Corrected log
+
+    chunksize: int, optional
+        Return an iterator over chunks of this size instead of
+        the whole dataframe
+
+    Returns
+    ----------
+    df: pd.DataFrame or iterator over pd.DataFrame
+        Corrected log
+    """
+
+    return pd.read_csv(path, dtype=np.float64, chunksize=chunksize,
+                       float_precision='round_trip')
@@ -0,0 +1,331 @@
+"""
+Append-only on-disk journal of a corrected track
+
+The journal is a header followed by records
+    type (uint8) | payload length (uint32) | payload | crc32 (uint32)
+of three types:
+    ROWS        first row index, number of rows and the rows as float64
+                columns in the order of ColumnarDataSet.COLUMNS
+    PATCH       first row index, number of rows and new angle_x, angle_y,
+                adj_x, adj_y of these rows (recalculation of earlier rows)
+    CHECKPOINT  CorrectorState after all preceding records
+
+Records are only appended, earlier rows are changed by patches. The file
+is synced once per checkpoint. On recovery everything after the last
+complete checkpoint (including a torn record of a crashed run)
+is dropped, so the dataset and the state always match.
+"""
+import os
+import struct
+import zlib
+from dataclasses import astuple
+
+import numpy as np
+import pandas as pd
+from src.data.chunked import INPUT_COLUMNS, OUTPUT_COLUMNS, concat_columns
+from src.data.make_dataset import ColumnarDataSet
+from src.functions.streaming import CorrectorState
+from src.functions.vectorized import (adjust,
+                                      backward_kernel,
+                                      recalc_first,
+                                      transfrom_arrays)
+
+MAGIC = b'GNSSJRNL'
+VERSION = 1
+ROWS, PATCH, CHECKPOINT = 1, 2, 3
+
+HEADER = struct.Struct('<8sI')
+RECORD = struct.Struct('<BI')
+CRC = struct.Struct('<I')
+RANGE = struct.Struct('<qq')
+# count, time_s ... adj_y, flag, anchor
+STATE = struct.Struct('<q10d?q')
+
+PATCH_COLUMNS = ('angle_x', 'angle_y', 'adj_x', 'adj_y')
+
+
+def pack_columns(start: int,
+                 columns: dict[str, np.ndarray],
+                 names: tuple[str, ...]) -> bytes:
+    count = len(columns[names[0]])
+    values = np.stack([np.asarray(columns[name], dtype='<f8')
+                       for name in names])
+    return RANGE.pack(start, count) + values.tobytes()
+
+
+def unpack_columns(payload: bytes,
+                   names: tuple[str, ...]
+                   ) -> tuple[int, dict[str, np.ndarray]]:
+    start, count = RANGE.unpack_from(payload)
+    values = np.frombuffer(payload, dtype='<f8', offset=RANGE.size)
+    values = values.reshape(len(names), count)
+    return start, dict(zip(names, values))
+
+
+class Journal:
+    """
+    Writer of the journal. New file gets a header, existing one
+    is appended to (it should be recovered first, see `recover`)
+
+    Methods
+    ----------
+    append(start: int, columns: dict[str, np.ndarray])
+        Writes new rows
+
+    patch(start: int, columns: dict[str, np.ndarray])
+        Writes new angles and corrected coordinates of earlier rows
+
+    checkpoint(state: CorrectorState)
+        Writes the state and syncs the file
+
+    close()
+        Closes the file, records after the last checkpoint are not synced
+    """
+
+    def __init__(self, path: str | os.PathLike) -> None:
+        self.path = path
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(HEADER.pack(MAGIC, VERSION))
+        self.records = 0
+
+    def _write(self, kind: int, payload: bytes) -> None:
+        head = RECORD.pack(kind, len(payload))
+        crc = zlib.crc32(payload, zlib.crc32(head))
+        self.file.write(head)
+        self.file.write(payload)
+        self.file.write(CRC.pack(crc))
+        self.records += 1
+
+    def append(self, start: int, columns: dict[str, np.ndarray]) -> None:
+        if len(columns['time_s']):
+            self._write(ROWS, pack_columns(start, columns,
+                                           ColumnarDataSet.COLUMNS))
+
+    def patch(self, start: int, columns: dict[str, np.ndarray]) -> None:
+        if len(columns['angle_x']):
+            self._write(PATCH, pack_columns(start, columns, PATCH_COLUMNS))
+
+    def checkpoint(self, state: CorrectorState) -> None:
+        self._write(CHECKPOINT, STATE.pack(*astuple(state)))
+        self.sync()
+
+    def sync(self) -> None:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self) -> 'Journal':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def read_records(file):
+    """
+    Yields (type, payload, offset of the end of the record) of a journal
+    opened for binary reading, until the end of the file or the first
+    incomplete or corrupted record
+    """
+
+    header = file.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return
+    magic, version = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'{file.name} is not a journal of version '
+                         f'{VERSION}')
+
+    while True:
+        head = file.read(RECORD.size)
+        if len(head) < RECORD.size:
+            return
+        kind, length = RECORD.unpack(head)
+        payload = file.read(length)
+        tail = file.read(CRC.size)
+        if (len(payload) < length or len(tail) < CRC.size
+                or CRC.unpack(tail)[0] != zlib.crc32(payload,
+                                                     zlib.crc32(head))):
+            return
+        yield kind, payload, file.tell()
+
+
+def recover(path: str | os.PathLike
+            ) -> tuple[ColumnarDataSet, CorrectorState]:
+    """
+    Restores dataset and corrector state of the last checkpoint
+    of a journal and truncates the file after it
+
+    Parameters
+    ----------
+    path: str or PathLike
+        Journal written by `Journal`
+
+    Returns
+    ----------
+    dataset: ColumnarDataSet
+        Rows with all patches applied
+
+    state: CorrectorState
+        State of the corrector after the last row,
+        a new state if there is no checkpoint
+    """
+
+    with open(path, 'rb') as file:
+        # A torn header is dropped too
+        end = HEADER.size if os.path.getsize(path) >= HEADER.size else 0
+        for kind, _, offset in read_records(file):
+            if kind == CHECKPOINT:
+                end = offset
+
+        dataset, state = ColumnarDataSet(), CorrectorState()
+        file.seek(0)
+        for kind, payload, offset in read_records(file):
+            if offset > end:
+                break
+            if kind == ROWS:
+                start, columns = unpack_columns(payload,
+                                                ColumnarDataSet.COLUMNS)
+                if start != len(dataset):
+                    raise ValueError(f'Rows from {start} follow '
+                                     f'{len(dataset)} rows in {path}')
+                dataset.extend_columns(columns)
+            elif kind == PATCH:
+                start, columns = unpack_columns(payload, PATCH_COLUMNS)
+                for name, values in columns.items():
+                    getattr(dataset, name)[start:start+len(values)] = values
+            elif kind == CHECKPOINT:
+                count, *values, flag, anchor = STATE.unpack(payload)
+                state = CorrectorState(count, *values, flag, anchor)
+
+    if os.path.getsize(path) > end:
+        with open(path, 'r+b') as file:
+            file.truncate(end)
+
+    return dataset, state
+
+
+def correct_csv_journaled(in_path: str | os.PathLike,
+                          journal_path: str | os.PathLike,
+                          chunksize: int = 100_000,
+                          recalc: bool = True,
+                          recalc_window: int | None = None,
+                          checkpoint_rows: int | None = None
+                          ) -> tuple[ColumnarDataSet, CorrectorState]:
+    """
+    Corrects a log in chunks keeping the journal of the corrected track.
+    If the journal exists, the run continues after the rows of its last
+    checkpoint instead of starting from the first row.
+
+    Rows are journaled as soon as they are corrected. When the
+    recalculation pass (see `recalc_prev_elements`) changes rows
+    journaled before, only their new angles and coordinates are
+    written as a patch. The result is identical to `transfrom_batch`.
+
+    Parameters
+    ----------
+    in_path: str or PathLike
+        Initial log with time_s, x_mm, y_mm, roll_deg, pitch_deg columns
+
+    journal_path: str or PathLike
+        Journal of the run
+
+    chunksize: int, default = 100_000
+        Number of rows read at once
+
+    recalc: bool, default = True
+        recalculate previous points' coordinates after
+        encountering points with the same roll
+
+    recalc_window: int, optional
+        Number of previous points to recalculate. All points by default
+
+    checkpoint_rows: int, optional
+        Number of rows between checkpoints (and syncs of the journal).
+        After every chunk by default
+
+    Returns
+    ----------
+    dataset: ColumnarDataSet
+        Corrected track
+
+    state: CorrectorState
+        State of the corrector after the last row
+    """
+
+    if os.path.exists(journal_path):
+        dataset, state = recover(journal_path)
+    else:
+        dataset, state = ColumnarDataSet(), CorrectorState()
+    checkpoint_rows = chunksize if checkpoint_rows is None else checkpoint_rows
+
+    with Journal(journal_path) as journal:
+        # Rows of the journal are skipped by a callable, pandas keeps
+        # a list-like of all skipped line numbers in a set
+        skipped = state.count
+        reader = pd.read_csv(in_path,
+                             chunksize=chunksize,
+                             usecols=INPUT_COLUMNS,
+                             dtype=np.float64,
+                             skiprows=lambda i: 0 < i <= skipped)
+        checkpointed = state.count
+
+        for chunk in reader:
+            count = state.count
+            columns = transfrom_arrays(*(chunk[name]
+                                         for name in INPUT_COLUMNS),
+                                       recalc=False,
+                                       state=state)
+
+            # Earlier rows changed by this chunk: the zero point gets
+            # the angle of the first one, the recalculation pass
+            # reaches back from the anchor
+            anchored = recalc and state.anchor >= count
+            first = recalc_first(state.anchor, recalc_window)
+            base = 0 if count == 1 else count
+            if anchored:
+                base = min(base, first)
+
+            if base < count:
+                columns = concat_columns(
+                    {name: getattr(dataset, name)[base:count]
+                     for name in OUTPUT_COLUMNS}, columns)
+                if count == 1:
+                    columns['angle_x'][0] = columns['angle_x'][1]
+            if anchored:
+                angles = columns['angle_x'].tolist()
+                backward_kernel(columns['x_mm'].tolist(),
+                                columns['y_mm'].tolist(),
+                                columns['shift_x'].tolist(),
+                                columns['shift_y'].tolist(),
+                                (-columns['shift_y']).tolist(),
+                                angles,
+                                state.anchor - base,
+                                first - base)
+                columns['angle_x'] = np.array(angles, dtype=np.float64)
+            if anchored or base < count:
+                adjust(columns)
+
+            if base < count:
+                patch = {name: columns[name][:count-base]
+                         for name in PATCH_COLUMNS}
+                journal.patch(base, patch)
+                for name, values in patch.items():
+                    getattr(dataset, name)[base:count] = values
+                columns = {name: values[count-base:]
+                           for name, values in columns.items()}
+
+            journal.append(count, columns)
+            dataset.extend_columns(columns)
+
+            if state.count - checkpointed >= checkpoint_rows:
+                journal.checkpoint(state)
+                checkpointed = state.count
+
+        if journal.records:
+            journal.checkpoint(state)
+
+    return dataset, state
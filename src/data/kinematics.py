@@ -0,0 +1,93 @@
+from typing import NamedTuple
+
+import numpy as np
+
+
+class Kinematics(NamedTuple):
+    """
+    Motion of the vehicle along the corrected track, one value per fix
+
+    Attributes
+    ---------
+    heading: np.ndarray
+        Direction of motion, angle between x-axis and velocity in radians
+
+    heading_rate: np.ndarray
+        Rate of change of heading in rad/s
+
+    speed: np.ndarray
+        Speed in mm/s
+
+    curvature: np.ndarray
+        Curvature of the track in 1/mm (heading rate over speed),
+        NaN where the vehicle stands still
+    """
+
+    heading: np.ndarray
+    heading_rate: np.ndarray
+    speed: np.ndarray
+    curvature: np.ndarray
+
+
+def smooth(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Centered moving average over an odd window (even one is increased
+    by one). The ends are padded by odd reflection, so uniform motion
+    near the ends is not distorted
+    """
+
+    half = window // 2
+    padded = np.pad(values, half, mode='reflect', reflect_type='odd')
+    return np.convolve(padded, np.ones(2 * half + 1) / (2 * half + 1),
+                       mode='valid')
+
+
+def track_kinematics(time_s,
+                     x_mm,
+                     y_mm,
+                     smoothing: int | None = None) -> Kinematics:
+    """
+    Calculates heading, heading rate, speed and curvature of the track
+    with array operations. Derivatives are taken by second order central
+    differences over uneven time steps (one-sided at the ends)
+
+    Parameters
+    ----------
+    time_s: array-like
+        Timestamps
+
+    x_mm, y_mm: array-like
+        Coordinates, e.g. corrected adj_x and adj_y
+
+    smoothing: int, optional
+        Window of moving average applied to the coordinates before
+        differentiation. No smoothing by default
+
+    Returns
+    ----------
+    kinematics: Kinematics
+        Arrays of the same length as the track. All values are NaN
+        for a track of less than two fixes
+    """
+
+    time_s = np.asarray(time_s, dtype=np.float64)
+    x_mm = np.asarray(x_mm, dtype=np.float64)
+    y_mm = np.asarray(y_mm, dtype=np.float64)
+
+    if len(time_s) < 2:
+        empty = np.full(len(time_s), np.nan)
+        return Kinematics(empty, empty.copy(), empty.copy(), empty.copy())
+
+    if smoothing is not None and smoothing > 1:
+        x_mm = smooth(x_mm, smoothing)
+        y_mm = smooth(y_mm, smoothing)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        v_x = np.gradient(x_mm, time_s)
+        v_y = np.gradient(y_mm, time_s)
+        heading = np.arctan2(v_y, v_x)
+        speed = np.hypot(v_x, v_y)
+        heading_rate = np.gradient(np.unwrap(heading), time_s)
+        curvature = np.where(speed > 0, heading_rate / speed, np.nan)
+
+    return Kinematics(heading, heading_rate, speed, curvature)
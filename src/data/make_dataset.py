@@ -1,5 +1,12 @@
 from dataclasses import dataclass, field
-import pandas as pd
+from typing import TYPE_CHECKING
+
+import numpy as np
+from src.data.kinematics import Kinematics, track_kinematics
+from src.data.spatial import GridIndex
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 @dataclass
@@ -116,43 +123,441 @@ class DataSet:
         self.adj_y.append(adj_y)
 
 
-def make_new_df(dataset: DataSet) -> pd.DataFrame:
+class Column:
+    """
+    Growable column of float64 values backed by a NumPy buffer.
+    The buffer doubles its capacity when full, so appends are amortized O(1)
+
+    Methods
+    ----------
+    append(value: float)
+        Adds value to the end of the column
+
+    extend(values)
+        Adds several values to the end of the column
+
+    view() -> np.ndarray
+        Returns filled part of the buffer without copying
+
+    from_array(values: np.ndarray) -> Column
+        Wraps existing float64 array without copying
+
+    Attributes
+    ---------
+    version: int
+        Number of changes of the column, used to invalidate caches
+    """
+
+    __slots__ = ('_data', '_size', 'version')
+
+    def __init__(self, capacity: int = 16) -> None:
+        self._data = np.empty(max(capacity, 1), dtype=np.float64)
+        self._size = 0
+        self.version = 0
+
+    @classmethod
+    def from_array(cls, values: np.ndarray) -> 'Column':
+        """
+        Wraps existing float64 array (e.g. memory-mapped) without copying.
+        The array is copied into a new buffer on the first append
+        """
+
+        column = cls.__new__(cls)
+        column._data = np.asarray(values, dtype=np.float64)
+        column._size = len(column._data)
+        column.version = 0
+        return column
+
+    def _reserve(self, size: int) -> None:
+        """
+        Makes sure the buffer can hold `size` values
+        """
+
+        capacity = len(self._data)
+        if size <= capacity:
+            return
+        capacity = max(capacity, 1)
+        while capacity < size:
+            capacity *= 2
+        data = np.empty(capacity, dtype=np.float64)
+        data[:self._size] = self._data[:self._size]
+        self._data = data
+
+    def _index(self, i: int) -> int:
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError('column index out of range')
+        return i
+
+    def append(self, value: float) -> None:
+        if self._size == len(self._data):
+            self._reserve(self._size + 1)
+        self._data[self._size] = value
+        self._size += 1
+        self.version += 1
+
+    def extend(self, values) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        size = self._size + len(values)
+        self._reserve(size)
+        self._data[self._size:size] = values
+        self._size = size
+        self.version += 1
+
+    def view(self) -> np.ndarray:
+        """
+        Returns filled part of the buffer without copying. The view stays
+        valid after new appends but does not include them
+        """
+
+        return self._data[:self._size]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.view()[i]
+        return self._data.item(self._index(i))
+
+    def __setitem__(self, i, value) -> None:
+        if isinstance(i, slice):
+            self.view()[i] = value
+        else:
+            self._data[self._index(i)] = value
+        self.version += 1
+
+    def __iter__(self):
+        return iter(self.view().tolist())
+
+
+class PairColumn:
+    """
+    View over two columns as a sequence of tuples.
+    Keeps `dataset.angle[i]` and `dataset.shift[i]` working for
+    the columnar storage. Empty tuple is stored as a pair of NaN.
+    """
+
+    __slots__ = ('first', 'second')
+
+    def __init__(self, first: Column, second: Column) -> None:
+        self.first = first
+        self.second = second
+
+    def append(self, value: tuple) -> None:
+        first, second = value if value else (np.nan, np.nan)
+        self.first.append(first)
+        self.second.append(second)
+
+    def extend(self, values) -> None:
+        for value in values:
+            self.append(value)
+
+    def __len__(self) -> int:
+        return len(self.first)
+
+    def __getitem__(self, i: int) -> tuple[float, float]:
+        return self.first[i], self.second[i]
+
+    def __setitem__(self, i: int, value: tuple) -> None:
+        self.first[i], self.second[i] = value
+
+    def __iter__(self):
+        return zip(self.first, self.second)
+
+
+class ColumnarDataSet:
+    """
+    Compact storage mode of DataSet. Every attribute is a growable float64
+    Column, angles and shifts are split into separate columns.
+    Per fix it takes 11 doubles instead of a dozen of boxed floats and two
+    tuples of the list-based DataSet.
+
+    Attributes
+    ---------
+    time_s, x_mm, y_mm, roll_deg, pitch_deg: Column
+        Initial data
+
+    angle_x, angle_y: Column
+        Rotation angles of x- and y-axis
+
+    shift_x, shift_y: Column
+        Shifts along x- and y-axis
+
+    adj_x, adj_y: Column
+        Corrected values of x and y coordinates
+
+    angle, shift: PairColumn
+        Tuple views for compatibility with DataSet
+
+    Methods
+    ----------
+    add_data(time_s: float,
+             x_mm: float,
+             y_mm: float,
+             roll_deg: float,
+             pitch_deg: float,
+             angle:tuple = (),
+             shift:tuple = (),
+             adj_x: float = 0,
+             adj_y: float = 0)
+        Adds data to the dataset
+
+    extend_columns(columns: dict[str, np.ndarray])
+        Adds whole columns to the dataset
+
+    columns() -> dict[str, np.ndarray]
+        Returns stored columns without copying
+
+    from_columns(columns: dict[str, np.ndarray]) -> ColumnarDataSet
+        Creates dataset over existing arrays without copying
+
+    kinematics(smoothing: int | None = None) -> Kinematics
+        Heading, heading rate, speed and curvature of the corrected track
+
+    spatial_index() -> GridIndex
+        Spatial index of the corrected track
+    """
+
+    COLUMNS = ('time_s', 'x_mm', 'y_mm', 'roll_deg', 'pitch_deg',
+               'angle_x', 'angle_y', 'shift_x', 'shift_y',
+               'adj_x', 'adj_y')
+    __slots__ = COLUMNS + ('_kinematics', '_spatial')
+
+    def __init__(self, capacity: int = 16) -> None:
+        for name in self.COLUMNS:
+            setattr(self, name, Column(capacity))
+        self._kinematics = {}
+        self._spatial = None
+
+    @property
+    def angle(self) -> PairColumn:
+        return PairColumn(self.angle_x, self.angle_y)
+
+    @property
+    def shift(self) -> PairColumn:
+        return PairColumn(self.shift_x, self.shift_y)
+
+    def __len__(self) -> int:
+        return len(self.time_s)
+
+    def add_data(self,
+                 time_s: float,
+                 x_mm: float,
+                 y_mm: float,
+                 roll_deg: float,
+                 pitch_deg: float,
+                 angle: tuple = (),
+                 shift: tuple = (),
+                 adj_x: float = 0,
+                 adj_y: float = 0) -> None:
+        """
+        Adds data to the dataset. Same as DataSet.add_data
+        """
+
+        self.time_s.append(time_s)
+        self.x_mm.append(x_mm)
+        self.y_mm.append(y_mm)
+        self.roll_deg.append(roll_deg)
+        self.pitch_deg.append(pitch_deg)
+
+        self.angle.append(angle)
+        self.shift.append(shift)
+        self.adj_x.append(adj_x)
+        self.adj_y.append(adj_y)
+
+    def extend_columns(self, columns: dict[str, np.ndarray]) -> None:
+        """
+        Adds whole columns to the dataset
+
+        Parameters
+        ----------
+        columns: dict[str, np.ndarray]
+            Arrays of equal length for every name in COLUMNS
+        """
+
+        for name in self.COLUMNS:
+            getattr(self, name).extend(columns[name])
+
+    def columns(self) -> dict[str, np.ndarray]:
+        """
+        Returns stored columns as NumPy arrays without copying
+        """
+
+        return {name: getattr(self, name).view() for name in self.COLUMNS}
+
+    @classmethod
+    def from_columns(cls,
+                     columns: dict[str, np.ndarray]) -> 'ColumnarDataSet':
+        """
+        Creates dataset over existing float64 arrays without copying
+
+        Parameters
+        ----------
+        columns: dict[str, np.ndarray]
+            Arrays of equal length for every name in COLUMNS
+        """
+
+        dataset = cls.__new__(cls)
+        for name in cls.COLUMNS:
+            setattr(dataset, name, Column.from_array(columns[name]))
+        dataset._kinematics = {}
+        dataset._spatial = None
+        return dataset
+
+    def kinematics(self, smoothing: int | None = None) -> Kinematics:
+        """
+        Calculates heading, heading rate, speed and curvature of
+        the corrected track, see `track_kinematics`. The result is cached
+        until time or corrected coordinates change, e.g. new fixes are
+        appended
+        """
+
+        key = (self.time_s.version, self.adj_x.version, self.adj_y.version)
+        cached = self._kinematics.get(smoothing)
+        if cached is None or cached[0] != key:
+            cached = key, track_kinematics(self.time_s.view(),
+                                           self.adj_x.view(),
+                                           self.adj_y.view(),
+                                           smoothing)
+            self._kinematics[smoothing] = cached
+        return cached[1]
+
+    def spatial_index(self) -> GridIndex:
+        """
+        Builds spatial index of the corrected points with timestamps,
+        see `GridIndex`. The index is cached until time or corrected
+        coordinates change
+        """
+
+        key = (self.time_s.version, self.adj_x.version, self.adj_y.version)
+        if self._spatial is None or self._spatial[0] != key:
+            self._spatial = key, GridIndex(self.adj_x.view(),
+                                           self.adj_y.view(),
+                                           self.time_s.view())
+        return self._spatial[1]
+
+
+def split_pairs(pairs: list[tuple]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Splits list of tuples into two float64 arrays. Empty tuples become NaN
+    """
+
+    first = np.full(len(pairs), np.nan)
+    second = np.full(len(pairs), np.nan)
+    filled = [i for i, pair in enumerate(pairs) if pair]
+    if filled:
+        values = np.array([pairs[i] for i in filled], dtype=np.float64)
+        first[filled], second[filled] = values[:, 0], values[:, 1]
+    return first, second
+
+
+def dataset_columns(dataset: DataSet | ColumnarDataSet
+                    ) -> dict[str, np.ndarray]:
+    """
+    Returns the data of the dataset as float64 columns named as
+    ColumnarDataSet.COLUMNS. Columns of ColumnarDataSet are not copied.
+
+    Parameters
+    ----------
+    dataset: DataSet or ColumnarDataSet
+        Dataset with calculated values after transformation
+
+    Returns
+    ----------
+    columns: dict[str, np.ndarray]
+        Columns of the dataset
+    """
+
+    if isinstance(dataset, ColumnarDataSet):
+        return dataset.columns()
+
+    angle_x, angle_y = split_pairs(dataset.angle)
+    shift_x, shift_y = split_pairs(dataset.shift)
+
+    return {'time_s': np.asarray(dataset.time_s, dtype=np.float64),
+            'x_mm': np.asarray(dataset.x_mm, dtype=np.float64),
+            'y_mm': np.asarray(dataset.y_mm, dtype=np.float64),
+            'roll_deg': np.asarray(dataset.roll_deg, dtype=np.float64),
+            'pitch_deg': np.asarray(dataset.pitch_deg, dtype=np.float64),
+            'angle_x': angle_x,
+            'angle_y': angle_y,
+            'shift_x': shift_x,
+            'shift_y': shift_y,
+            'adj_x': np.asarray(dataset.adj_x, dtype=np.float64),
+            'adj_y': np.asarray(dataset.adj_y, dtype=np.float64)}
+
+
+def make_new_df(dataset: DataSet | ColumnarDataSet,
+                legacy_tuples: bool = False) -> 'pd.DataFrame':
     """
     Creates new pandas dataframe from an instance of class DataSet
 
     Parameters
     ----------
-    dataset: DataSet object
+    dataset: DataSet or ColumnarDataSet object
         Dataset with calculated values after transformation
 
+    legacy_tuples: bool, default = False
+        store angles and shifts as `angle` and `shift` columns of tuples
+        instead of float64 columns angle_x, angle_y, shift_x, shift_y
+
     Returns
     ----------
     df_new: pandas.DataFrame
-        Dataframe with values from dataset
+        Dataframe with values from dataset. Columns of ColumnarDataSet
+        are used without copying.
     """
 
-    df_new = pd.DataFrame(data={'time_s': dataset.time_s,
-                                'x_mm': dataset.x_mm,
-                                'y_mm': dataset.y_mm,
-                                'roll_deg': dataset.roll_deg,
-                                'pitch_deg': dataset.pitch_deg,
-                                'angle': dataset.angle,
-                                'shift': dataset.shift,
-                                'adj_x': dataset.adj_x,
-                                'adj_y': dataset.adj_y})
+    import pandas as pd
+
+    if legacy_tuples:
+        return pd.DataFrame(data={'time_s': list(dataset.time_s),
+                                  'x_mm': list(dataset.x_mm),
+                                  'y_mm': list(dataset.y_mm),
+                                  'roll_deg': list(dataset.roll_deg),
+                                  'pitch_deg': list(dataset.pitch_deg),
+                                  'angle': list(dataset.angle),
+                                  'shift': list(dataset.shift),
+                                  'adj_x': list(dataset.adj_x),
+                                  'adj_y': list(dataset.adj_y)})
+
+    df_new = pd.DataFrame(data=dataset_columns(dataset), copy=False)
 
     return df_new
 
 
-def extract_angles(dataset: DataSet) -> list:
+def dataset_kinematics(dataset: DataSet | ColumnarDataSet,
+                       smoothing: int | None = None) -> Kinematics:
     """
-    Extract angles of rotation between x-axis of global reference frame
-    and x-axis of local reference frame
+    Calculates heading, heading rate, speed and curvature of
+    the corrected track, cached for ColumnarDataSet
+
+    Parameters
+    ----------
+    dataset: DataSet or ColumnarDataSet
+        Dataset with calculated values after transformation
+
+    smoothing: int, optional
+        Window of moving average applied to the coordinates
+
+    Returns
+    ----------
+    kinematics: Kinematics
+        Arrays of heading, heading rate, speed and curvature
     """
 
-    angles = []
+    if isinstance(dataset, ColumnarDataSet):
+        return dataset.kinematics(smoothing)
+    return track_kinematics(dataset.time_s, dataset.adj_x, dataset.adj_y,
+                            smoothing)
+
 
-    for angle in dataset.angle:
-        angles.append(angle[0])
+def extract_angles(dataset: DataSet | ColumnarDataSet) -> list:
+    """
+    Extract angles of rotation between x-axis of global reference frame
+    and x-axis of local reference frame
+    """
 
-    return angles
+    return dataset_columns(dataset)['angle_x'].tolist()
@@ -0,0 +1,265 @@
+from typing import TYPE_CHECKING
+
+import numpy as np
+from src.data.make_dataset import DataSet, ColumnarDataSet
+from src.functions.profile import VehicleProfile
+from src.functions.vectorized import (as_column,
+                                      store_columns,
+                                      transfrom_arrays)
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+INPUT_COLUMNS = ('time_s', 'x_mm', 'y_mm', 'roll_deg', 'pitch_deg')
+# Gap in seconds which splits the track. Fixes in data/data.csv
+# come every 0.18-0.23 s
+MAX_GAP = 1.0
+# Step in mm and speed in mm/s below which the vehicle is standing,
+# GNSS jitter of a standing vehicle stays within a few mm
+STOP_STEP = 5.0
+STOP_SPEED = 50.0
+
+
+def segment_ids(time_s, max_gap: float = MAX_GAP) -> np.ndarray:
+    """
+    Numbers segments of the track split by gaps in time longer than
+    `max_gap` seconds (and by steps back in time)
+
+    Returns
+    ----------
+    segment: np.ndarray
+        Segment of each fix, 0, 1, 2...
+    """
+
+    time_s = as_column(time_s)
+    if not len(time_s):
+        return np.zeros(0, dtype=np.int64)
+    step = np.diff(time_s)
+    breaks = (step > max_gap) | (step < 0)
+    return np.concatenate([[0], np.cumsum(breaks)]).astype(np.int64)
+
+
+def segment_bounds(segment: np.ndarray) -> np.ndarray:
+    """
+    Returns first row of every segment and the number of rows
+    """
+
+    starts = np.flatnonzero(np.diff(segment)) + 1
+    return np.concatenate([[0], starts, [len(segment)]]).astype(np.intp)
+
+
+def stationary_mask(time_s,
+                    x_mm,
+                    y_mm,
+                    min_step: float = STOP_STEP,
+                    min_speed: float = STOP_SPEED) -> np.ndarray:
+    """
+    Detects fixes received while the vehicle is standing: the step from
+    the previous fix is shorter than `min_step` or slower than
+    `min_speed`. The first two fixes are never stationary, they give
+    the initial heading
+
+    Parameters
+    ----------
+    time_s, x_mm, y_mm: array-like
+        Timestamps and coordinates
+
+    min_step: float, default = STOP_STEP
+        Step in mm
+
+    min_speed: float, default = STOP_SPEED
+        Speed in mm/s
+
+    Returns
+    ----------
+    stationary: np.ndarray
+        Boolean mask of the fixes
+    """
+
+    time_s, x_mm, y_mm = as_column(time_s), as_column(x_mm), as_column(y_mm)
+    if not len(x_mm):
+        return np.zeros(0, dtype=bool)
+    step = np.hypot(np.diff(x_mm), np.diff(y_mm))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = step / np.diff(time_s)
+    stationary = np.concatenate([[False], (step < min_step)
+                                 | (speed < min_speed)])
+    stationary[:2] = False
+    return stationary
+
+
+def resample(columns: dict[str, np.ndarray],
+             rate: float,
+             segment: np.ndarray | None = None) -> dict[str, np.ndarray]:
+    """
+    Resamples the track to a fixed rate inside every segment,
+    the grid of each segment starts at its first fix.
+    Coordinates are interpolated linearly, roll and pitch are taken
+    from the last fix before the time (they are quantized by the
+    sensor and equal roll of two fixes is what anchors the correction)
+
+    Parameters
+    ----------
+    columns: dict[str, np.ndarray]
+        Columns time_s, x_mm, y_mm, roll_deg, pitch_deg, time in
+        ascending order inside each segment
+
+    rate: float
+        Fixes per second
+
+    segment: np.ndarray, optional
+        Segment of each fix, see `segment_ids`. One segment by default
+
+    Returns
+    ----------
+    columns: dict[str, np.ndarray]
+        Resampled columns and the segment of each new fix
+    """
+
+    time_s = as_column(columns['time_s'])
+    if segment is None:
+        segment = np.zeros(len(time_s), dtype=np.int64)
+    if not len(time_s):
+        return {**{name: np.empty(0) for name in INPUT_COLUMNS},
+                'segment': np.empty(0, dtype=np.int64)}
+
+    bounds = segment_bounds(segment)
+    t0, t1 = time_s[bounds[:-1]], time_s[bounds[1:] - 1]
+    counts = np.floor((t1 - t0) * rate + 1e-9).astype(np.intp) + 1
+
+    # Offsets k = 0, 1... inside every segment and its start time
+    ends = np.cumsum(counts)
+    k = np.arange(ends[-1]) - np.repeat(ends - counts, counts)
+    new_time = np.repeat(t0, counts) + k / rate
+    new_segment = np.repeat(segment[bounds[:-1]], counts)
+
+    # Time since the start of the segment shifted by the number of
+    # the segment is ascending over all fixes, so one binary search
+    # finds the fix before each new time inside its segment
+    duration = float(np.max(t1 - t0)) + 1.0
+    number = np.repeat(np.arange(len(counts)), np.diff(bounds))
+    key = number * duration + (time_s - np.repeat(t0, np.diff(bounds)))
+    new_key = np.repeat(np.arange(len(counts)), counts) * duration + k / rate
+    first = np.repeat(bounds[:-1], counts)
+    last = np.repeat(bounds[1:] - 1, counts)
+    prev = np.clip(np.searchsorted(key, new_key, side='right') - 1,
+                   first, last)
+    nxt = np.minimum(prev + 1, last)
+    span = time_s[nxt] - time_s[prev]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight = np.where(span > 0, (new_time - time_s[prev]) / span, 0.0)
+    weight = np.clip(weight, 0.0, 1.0)
+
+    resampled = {'time_s': new_time}
+    for name in ('x_mm', 'y_mm'):
+        values = as_column(columns[name])
+        resampled[name] = values[prev] + weight * (values[nxt] - values[prev])
+    for name in ('roll_deg', 'pitch_deg'):
+        resampled[name] = as_column(columns[name])[prev]
+    resampled['segment'] = new_segment
+    return resampled
+
+
+def prepare_track(time_s,
+                  x_mm,
+                  y_mm,
+                  roll_deg,
+                  pitch_deg,
+                  max_gap: float | None = MAX_GAP,
+                  rate: float | None = None) -> dict[str, np.ndarray]:
+    """
+    Splits the track by gaps and optionally resamples it to a fixed
+    rate with array operations only
+
+    Parameters
+    ----------
+    time_s, x_mm, y_mm, roll_deg, pitch_deg: array-like
+        Columns of the initial data
+
+    max_gap: float or None, default = MAX_GAP
+        Gap in seconds which starts a new segment. None keeps
+        the whole track as one segment
+
+    rate: float, optional
+        Fixes per second after resampling. Fixes are kept as they are
+        by default
+
+    Returns
+    ----------
+    columns: dict[str, np.ndarray]
+        Columns of the track and the segment of each fix
+    """
+
+    columns = {'time_s': as_column(time_s),
+               'x_mm': as_column(x_mm),
+               'y_mm': as_column(y_mm),
+               'roll_deg': as_column(roll_deg),
+               'pitch_deg': as_column(pitch_deg)}
+    segment = (np.zeros(len(columns['time_s']), dtype=np.int64)
+               if max_gap is None
+               else segment_ids(columns['time_s'], max_gap))
+
+    if rate is not None:
+        return resample(columns, rate, segment)
+    columns['segment'] = segment
+    return columns
+
+
+def transfrom_segmented(df: 'pd.DataFrame',
+                        dataset: DataSet | ColumnarDataSet,
+                        max_gap: float | None = MAX_GAP,
+                        rate: float | None = None,
+                        recalc: bool = True,
+                        recalc_window: int | None = None,
+                        profile: VehicleProfile | None = None
+                        ) -> np.ndarray:
+    """
+    Version of `transfrom_batch` which corrects segments of the track
+    separated by gaps in time independently: the angle is never
+    calculated across a gap and every segment looks for its own pair
+    of fixes with the same roll. See `prepare_track`
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Initial pandas DataFrame
+
+    dataset: DataSet or ColumnarDataSet
+        Instance of class DataSet where the data will be stored.
+        With `rate` it gets the resampled fixes
+
+    max_gap: float or None, default = MAX_GAP
+        Gap in seconds which starts a new segment
+
+    rate: float, optional
+        Fixes per second after resampling
+
+    recalc: bool, default = True
+        recalculate previous points' coordinates after
+        encountering points with the same roll
+
+    recalc_window: int, optional
+        Number of previous points to recalculate. All points by default
+
+    profile: VehicleProfile, optional
+        Installation geometry of GNSS module
+
+    Returns
+    ----------
+    segment: np.ndarray
+        Segment of each stored fix
+    """
+
+    columns = prepare_track(*(df[name] for name in INPUT_COLUMNS),
+                            max_gap=max_gap, rate=rate)
+    segment = columns.pop('segment')
+    single = not len(segment) or segment[-1] == segment[0]
+
+    columns = transfrom_arrays(*(columns[name] for name in INPUT_COLUMNS),
+                               recalc=recalc,
+                               recalc_window=recalc_window,
+                               profile=profile,
+                               vehicle_id=None if single else segment)
+    store_columns(columns, dataset)
+
+    return segment
@@ -0,0 +1,198 @@
+import numpy as np
+
+# Average number of points in a cell of GridIndex
+CELL_POINTS = 16
+
+
+def concat_ranges(starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+    """
+    Returns concatenation of ranges [starts[i], stops[i]) without
+    a Python loop
+    """
+
+    lengths = stops - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.intp)
+    nonempty = lengths > 0
+    starts, lengths = starts[nonempty], lengths[nonempty]
+    # Step is 1 inside a range and jumps to the next start between ranges
+    steps = np.ones(total, dtype=np.intp)
+    ends = np.cumsum(lengths)
+    steps[0] = starts[0]
+    steps[ends[:-1]] = starts[1:] - (starts[:-1] + lengths[:-1]) + 1
+    return np.cumsum(steps)
+
+
+class GridIndex:
+    """
+    Spatial index of a track over a regular grid, built once per track.
+    Points are sorted by their cells row by row, so the points of
+    consecutive cells of a row are one slice found by binary search,
+    and a query touches only the cells overlapping the bounding box.
+    Only occupied cells are stored. Queries cost about the number of
+    returned points and not the length of the track.
+
+    Attributes
+    ---------
+    x, y: np.ndarray
+        Coordinates of the points, e.g. corrected adj_x and adj_y
+
+    time_s: np.ndarray or None
+        Timestamps of the points for time window queries
+
+    cell: float
+        Side of a cell in units of the coordinates
+
+    Methods
+    ----------
+    box(xlim: tuple[float, float],
+        ylim: tuple[float, float]) -> np.ndarray
+        Indices of points inside the bounding box
+
+    window(start: float, stop: float) -> np.ndarray
+        Indices of points inside the time window
+
+    query(bbox: tuple[float, float, float, float] | None = None,
+          time_window: tuple[float, float] | None = None) -> np.ndarray
+        Indices of points inside both the bounding box and the window
+
+    extent(indices: np.ndarray | None = None) -> tuple[tuple, tuple]
+        Limits of the points along x and y
+    """
+
+    def __init__(self,
+                 x,
+                 y,
+                 time_s=None,
+                 cell: float | None = None) -> None:
+        """
+        Parameters
+        ----------
+        x, y: array-like
+            Coordinates of the points. Points with NaN are not indexed
+
+        time_s: array-like, optional
+            Timestamps of the points
+
+        cell: float, optional
+            Side of a cell. By default about CELL_POINTS points of
+            a track evenly spread along its extent fall into a cell
+        """
+
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.time_s = (None if time_s is None
+                       else np.asarray(time_s, dtype=np.float64))
+
+        valid = np.flatnonzero(np.isfinite(self.x) & np.isfinite(self.y))
+        if len(valid):
+            self.origin = (self.x[valid].min(), self.y[valid].min())
+            width = self.x[valid].max() - self.origin[0]
+            height = self.y[valid].max() - self.origin[1]
+        else:
+            self.origin, width, height = (0.0, 0.0), 0.0, 0.0
+
+        if cell is None:
+            # Tracks are lines rather than areas: the cells are sized
+            # by the length of the track, not by its area
+            cell = max(width, height) * CELL_POINTS / max(len(valid), 1)
+        self.cell = max(float(cell), 1e-9)
+        self.shape = (int(height // self.cell) + 1,
+                      int(width // self.cell) + 1)
+
+        cells = self._cells(self.x[valid], self.y[valid])
+        order = np.argsort(cells, kind='stable')
+        self.order = valid[order]
+        self.cells = cells[order]
+
+        self._time_order = None
+        if self.time_s is not None and np.any(np.diff(self.time_s) < 0):
+            self._time_order = np.argsort(self.time_s, kind='stable')
+
+    def _cells(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        col = ((x - self.origin[0]) // self.cell).astype(np.int64)
+        row = ((y - self.origin[1]) // self.cell).astype(np.int64)
+        return row * self.shape[1] + col
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def box(self,
+            xlim: tuple[float, float],
+            ylim: tuple[float, float]) -> np.ndarray:
+        """
+        Returns sorted indices of points inside the bounding box
+        (borders included)
+        """
+
+        (x0, x1), (y0, y1) = sorted(xlim), sorted(ylim)
+        rows, cols = self.shape
+        col0 = max(int((x0 - self.origin[0]) // self.cell), 0)
+        col1 = min(int((x1 - self.origin[0]) // self.cell), cols - 1)
+        row0 = max(int((y0 - self.origin[1]) // self.cell), 0)
+        row1 = min(int((y1 - self.origin[1]) // self.cell), rows - 1)
+        if col0 > col1 or row0 > row1:
+            return np.empty(0, dtype=np.intp)
+
+        rows = np.arange(row0, row1 + 1, dtype=np.int64) * cols
+        starts = np.searchsorted(self.cells, rows + col0, side='left')
+        stops = np.searchsorted(self.cells, rows + col1, side='right')
+        found = self.order[concat_ranges(starts, stops)]
+        x, y = self.x[found], self.y[found]
+        inside = (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+        return np.sort(found[inside])
+
+    def window(self, start: float, stop: float) -> np.ndarray:
+        """
+        Returns sorted indices of points with start <= time_s <= stop
+        """
+
+        if self.time_s is None:
+            raise ValueError('Index is built without timestamps')
+
+        times = (self.time_s if self._time_order is None
+                 else self.time_s[self._time_order])
+        first = np.searchsorted(times, start, side='left')
+        last = np.searchsorted(times, stop, side='right')
+        if self._time_order is None:
+            return np.arange(first, last)
+        return np.sort(self._time_order[first:last])
+
+    def query(self,
+              bbox: tuple[float, float, float, float] | None = None,
+              time_window: tuple[float, float] | None = None
+              ) -> np.ndarray:
+        """
+        Returns sorted indices of points inside the bounding box
+        (x_min, x_max, y_min, y_max) and the time window (start, stop).
+        All points if neither is given
+        """
+
+        if bbox is None and time_window is None:
+            return np.arange(len(self))
+        if bbox is None:
+            return self.window(*time_window)
+
+        found = self.box(bbox[:2], bbox[2:])
+        if time_window is not None:
+            if self.time_s is None:
+                raise ValueError('Index is built without timestamps')
+            times = self.time_s[found]
+            found = found[(times >= time_window[0])
+                          & (times <= time_window[1])]
+        return found
+
+    def extent(self, indices: np.ndarray | None = None
+               ) -> tuple[tuple[float, float], tuple[float, float]]:
+        """
+        Returns limits (min, max) of the points along x and y,
+        of all indexed points by default
+        """
+
+        if indices is None:
+            indices = self.order
+        if len(indices) == 0:
+            return (np.nan, np.nan), (np.nan, np.nan)
+        x, y = self.x[indices], self.y[indices]
+        return (np.nanmin(x), np.nanmax(x)), (np.nanmin(y), np.nanmax(y))
@@ -0,0 +1,192 @@
+import os
+import shutil
+from typing import TYPE_CHECKING, Mapping
+
+import numpy as np
+from src.data.make_dataset import DataSet, ColumnarDataSet, dataset_columns
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+def track_columns(track) -> dict[str, np.ndarray]:
+    """
+    Returns float64 columns of a corrected track given as DataSet,
+    ColumnarDataSet, DataFrame made by `make_new_df` or dict of arrays
+    """
+
+    if isinstance(track, (DataSet, ColumnarDataSet)):
+        return dataset_columns(track)
+    if isinstance(track, Mapping):
+        return {name: np.asarray(values, dtype=np.float64)
+                for name, values in track.items()}
+
+    import pandas as pd
+
+    return {name: track[name].to_numpy(dtype=np.float64)
+            for name in track.columns
+            if pd.api.types.is_numeric_dtype(track[name])}
+
+
+def save_npy(track, path: str | os.PathLike) -> None:
+    """
+    Saves corrected track as a directory with one .npy file per column.
+    The directory appears only when all columns are written
+
+    Parameters
+    ----------
+    track: DataSet, ColumnarDataSet, pd.DataFrame or dict of arrays
+        Corrected track
+
+    path: str or PathLike
+        Directory to create. Existing directory is replaced
+    """
+
+    # Without the trailing separator 'track/' gets 'track.tmp' next to it,
+    # not 'track/.tmp' inside the directory being replaced
+    path = os.fspath(path).rstrip(os.sep)
+    tmp_path = f'{path}.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    for name, values in track_columns(track).items():
+        np.save(os.path.join(tmp_path, f'{name}.npy'),
+                np.ascontiguousarray(values))
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+
+def load_npy(path: str | os.PathLike,
+             columns: list[str] | None = None,
+             mmap_mode: str | None = 'r') -> dict[str, np.ndarray]:
+    """
+    Opens track saved by `save_npy`. By default the columns are memory
+    mapped, so opening is instant and only touched rows are read
+
+    Parameters
+    ----------
+    path: str or PathLike
+        Directory with .npy files
+
+    columns: list[str], optional
+        Columns to open. All columns by default
+
+    mmap_mode: str or None, default = 'r'
+        Passed to np.load. 'c' allows changes in memory only,
+        None reads columns into memory
+
+    Returns
+    ----------
+    columns: dict[str, np.ndarray]
+        Columns of the track
+    """
+
+    if columns is None:
+        columns = sorted(name[:-4] for name in os.listdir(path)
+                         if name.endswith('.npy'))
+        # Keep the usual order of columns
+        order = {name: i for i, name in enumerate(ColumnarDataSet.COLUMNS)}
+        columns.sort(key=lambda name: order.get(name, len(order)))
+
+    return {name: np.load(os.path.join(path, f'{name}.npy'),
+                          mmap_mode=mmap_mode)
+            for name in columns}
+
+
+def load_npy_df(path: str | os.PathLike,
+                columns: list[str] | None = None) -> 'pd.DataFrame':
+    """
+    Opens track saved by `save_npy` as a dataframe over memory-mapped
+    columns
+    """
+
+    import pandas as pd
+
+    return pd.DataFrame(load_npy(path, columns), copy=False)
+
+
+def load_npy_dataset(path: str | os.PathLike) -> ColumnarDataSet:
+    """
+    Opens track saved by `save_npy` as ColumnarDataSet. Columns are
+    mapped copy-on-write: changes stay in memory and new data can be
+    appended
+    """
+
+    return ColumnarDataSet.from_columns(load_npy(path, mmap_mode='c'))
+
+
+def time_slice(time_s: np.ndarray, start: float, stop: float) -> slice:
+    """
+    Returns slice of rows with start <= time_s < stop
+    for sorted timestamps
+    """
+
+    return slice(int(np.searchsorted(time_s, start, side='left')),
+                 int(np.searchsorted(time_s, stop, side='left')))
+
+
+def load_npy_time_slice(path: str | os.PathLike,
+                        start: float,
+                        stop: float,
+                        columns: list[str] | None = None
+                        ) -> dict[str, np.ndarray]:
+    """
+    Reads rows with start <= time_s < stop of track saved by `save_npy`.
+    Timestamps are searched with binary search over the memory-mapped
+    column, so only the requested rows are read from disk
+
+    Parameters
+    ----------
+    path: str or PathLike
+        Directory with .npy files
+
+    start, stop: float
+        Time window
+
+    columns: list[str], optional
+        Columns to read. All columns by default
+
+    Returns
+    ----------
+    columns: dict[str, np.ndarray]
+        Memory-mapped columns restricted to the window
+    """
+
+    time_s = np.load(os.path.join(path, 'time_s.npy'), mmap_mode='r')
+    rows = time_slice(time_s, start, stop)
+
+    return {name: values[rows]
+            for name, values in load_npy(path, columns).items()}
+
+
+def save_parquet(track, path: str | os.PathLike) -> None:
+    """
+    Saves corrected track as Parquet file. Needs pyarrow or fastparquet
+    """
+
+    import pandas as pd
+
+    pd.DataFrame(track_columns(track), copy=False).to_parquet(path,
+                                                              index=False)
+
+
+def load_parquet(path: str | os.PathLike,
+                 columns: list[str] | None = None,
+                 start: float | None = None,
+                 stop: float | None = None) -> 'pd.DataFrame':
+    """
+    Reads track saved by `save_parquet`. With start and stop only
+    row groups overlapping the time window are read.
+    Needs pyarrow or fastparquet
+    """
+
+    import pandas as pd
+
+    filters = []
+    if start is not None:
+        filters.append(('time_s', '>=', start))
+    if stop is not None:
+        filters.append(('time_s', '<', stop))
+
+    return pd.read_parquet(path, columns=columns, filters=filters or None)
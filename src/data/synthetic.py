@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+
+def make_track(n: int,
+               seed: int = 0,
+               start_time: float = 1621693264.0,
+               speed_mm_s: float = 600.0,
+               turn_rate: float = 0.02,
+               roll_mean: float = 3.9,
+               pitch_mean: float = -1.2) -> pd.DataFrame:
+    """
+    Generates synthetic GNSS/IMU log in the format of data/data.csv
+
+    The vehicle moves with noisy speed, keeps its heading on straight
+    parts and turns from time to time. Roll and pitch drift slowly around
+    their means with sensor noise and are quantized to 0.01 degree,
+    coordinates are rounded to mm. Update intervals vary
+    between 0.18 and 0.23 s.
+
+    Parameters
+    ----------
+    n: int
+        Number of fixes
+
+    seed: int, default = 0
+        Seed of random generator
+
+    start_time: float
+        Timestamp of the first fix
+
+    speed_mm_s: float, default = 600
+        Mean speed in mm/s
+
+    turn_rate: float, default = 0.02
+        Probability to start a turn at each fix
+
+    roll_mean, pitch_mean: float
+        Mean roll and pitch in degrees
+
+    Returns
+    ----------
+    df: pd.DataFrame
+        Columns time_s, x_mm, y_mm, roll_deg, pitch_deg
+    """
+
+    if n == 0:
+        return pd.DataFrame({name: np.empty(0) for name in
+                             ('time_s', 'x_mm', 'y_mm',
+                              'roll_deg', 'pitch_deg')})
+
+    rng = np.random.default_rng(seed)
+
+    dt = rng.uniform(0.18, 0.23, n)
+    time_s = start_time + np.concatenate([[0.0], np.cumsum(dt[1:])])
+
+    # Heading rate: zero on straight parts, constant during turns
+    turning = rng.random(n) < turn_rate
+    turn_id = np.cumsum(turning)
+    turn_rates = rng.normal(0, 0.15, turn_id[-1] + 1)
+    turn_length = rng.integers(10, 60, turn_id[-1] + 1)
+    since_start = np.arange(n) - np.maximum.accumulate(
+        np.where(turning, np.arange(n), 0))
+    rate = np.where((turn_id > 0) & (since_start < turn_length[turn_id]),
+                    turn_rates[turn_id], 0.0)
+    heading = rng.uniform(-np.pi, np.pi) + np.cumsum(rate * dt)
+
+    speed = np.clip(rng.normal(speed_mm_s, 0.05 * speed_mm_s, n), 0, None)
+    step = speed * dt
+    x_mm = 9521 + np.cumsum(step * np.cos(heading))
+    y_mm = -35074 + np.cumsum(step * np.sin(heading))
+
+    def attitude(mean: float) -> np.ndarray:
+        # Slow drift as a sum of long waves plus sensor noise
+        periods = rng.uniform(30, 600, 4)
+        phases = rng.uniform(0, 2 * np.pi, 4)
+        amplitudes = rng.uniform(0.05, 0.3, 4)
+        drift = sum(amplitude * np.sin(2 * np.pi * (time_s - start_time)
+                                       / period + phase)
+                    for amplitude, period, phase
+                    in zip(amplitudes, periods, phases))
+        return np.round(mean + drift + rng.normal(0, 0.05, n), 2)
+
+    return pd.DataFrame({'time_s': time_s,
+                         'x_mm': np.round(x_mm),
+                         'y_mm': np.round(y_mm),
+                         'roll_deg': attitude(roll_mean),
+                         'pitch_deg': attitude(pitch_mean)})
@@ -1,6 +1,99 @@
+import json
+from time import perf_counter
+from typing import TYPE_CHECKING
+
 import numpy as np
-import pandas as pd
 from src.data.make_dataset import DataSet
+from src.functions import scalar
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from src.functions.profile import VehicleProfile
+
+
+class Instrumentation:
+    """
+    Opt-in counters and timers of the per-row correction.
+    Pass an instance as `stats` to `transfrom`; when it is not passed
+    the hot path only checks `stats is not None`
+
+    Stages (seconds)
+    ----------
+    row_access: `df.iloc` row access
+    trig: angles, shifts and unrolling of the previous point
+    add_data: appends to the dataset
+    recalc: the recalculation pass of previous points
+    setup: zero and first elements
+
+    Counters
+    ----------
+    fixes: number of processed fixes
+    equal_roll: fixes taking the branch of two points with the same roll
+    backroll: fixes taking the backroll branch
+    recalc_passes, recalc_points: number and size of recalculation passes
+
+    Methods
+    ----------
+    to_dict() -> dict
+        Counters, timers and total time
+
+    to_json(**kwargs) -> str
+        Same as `to_dict` serialized to JSON
+    """
+
+    STAGES = ('row_access', 'trig', 'add_data', 'recalc', 'setup')
+    COUNTERS = ('fixes', 'equal_roll', 'backroll',
+                'recalc_passes', 'recalc_points')
+
+    def __init__(self, profiler=None) -> None:
+        """
+        Parameters
+        ----------
+        profiler: optional
+            Profiler running only inside `transfrom`, an object with
+            start()/stop() (e.g. pyinstrument.Profiler) or
+            enable()/disable() methods (e.g. cProfile.Profile)
+        """
+
+        self.profiler = profiler
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.timers = dict.fromkeys(self.STAGES, 0.0)
+        self.total = 0.0
+        self._start = 0.0
+        self._last = 0.0
+
+    def start(self) -> None:
+        if self.profiler is not None:
+            start = getattr(self.profiler, 'start', None)
+            (start or self.profiler.enable)()
+        self._start = self._last = perf_counter()
+
+    def stop(self) -> None:
+        self.total += perf_counter() - self._start
+        if self.profiler is not None:
+            stop = getattr(self.profiler, 'stop', None)
+            (stop or self.profiler.disable)()
+
+    def lap(self, stage: str) -> None:
+        """
+        Adds the time since the previous lap to the stage
+        """
+
+        now = perf_counter()
+        self.timers[stage] += now - self._last
+        self._last = now
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] += n
+
+    def to_dict(self) -> dict:
+        return {'counters': dict(self.counters),
+                'timers_s': dict(self.timers),
+                'total_s': self.total,
+                'other_s': self.total - sum(self.timers.values())}
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.to_dict(), **kwargs)
 
 
 def calc_rot_angle(x0: float,
@@ -26,6 +119,9 @@ def calc_rot_angle(x0: float,
     alpha_ y: float
     """
 
+    if scalar.is_scalar(x0, y0, x1, y1):
+        return scalar.calc_rot_angle(x0, y0, x1, y1)
+
     y_delta = y1-y0
     x_delta = x1-x0
     alpha_x = np.arctan2(y_delta, x_delta)
@@ -64,6 +160,9 @@ def caluclate_shifts(roll_deg: float,
         shift along y-axis of local frame in mm.
     """
 
+    if scalar.is_scalar(roll_deg, pitch_deg, height):
+        return scalar.caluclate_shifts(roll_deg, pitch_deg, height)
+
     y_shift = np.abs(height * np.sin(np.deg2rad(roll_deg)))
     height_adjusted = np.abs(height * np.cos(np.deg2rad(roll_deg)))
     x_shift = np.abs(height_adjusted * np.sin(np.deg2rad(pitch_deg)))
@@ -75,11 +174,40 @@ def calculate_backroll(roll_deg: float, height: float = 1500) -> float:
     Calculates shift along y-axis in the backward direction
     """
 
+    if scalar.is_scalar(roll_deg, height):
+        return scalar.calculate_backroll(roll_deg, height)
+
     y_shift = -np.abs(height * np.sin(np.deg2rad(roll_deg)))
 
     return y_shift
 
 
+def profile_shifts(roll_deg: float,
+                   pitch_deg: float,
+                   profile: 'VehicleProfile | None' = None
+                   ) -> tuple[float, float]:
+    """
+    Calculates shifts for the vehicle profile,
+    see `caluclate_shifts` for the default one
+    """
+
+    if profile is None:
+        return caluclate_shifts(roll_deg, pitch_deg)
+    return profile.shift(roll_deg, pitch_deg)
+
+
+def profile_backroll(roll_deg: float,
+                     profile: 'VehicleProfile | None' = None) -> float:
+    """
+    Calculates shift along y-axis in the backward direction
+    for the vehicle profile, see `calculate_backroll`
+    """
+
+    if profile is None:
+        return calculate_backroll(roll_deg)
+    return -profile.shift(roll_deg, 0.0)[1]
+
+
 def apply_shifts(x: float,
                  y: float,
                  alpha_x: float,
@@ -108,6 +236,9 @@ def apply_shifts(x: float,
         Coordinates of the point adjusted for tilt
     """
 
+    if scalar.is_scalar(x, y, alpha_x, alpha_y, shift_x, shift_y):
+        return scalar.apply_shifts(x, y, alpha_x, alpha_y, shift_x, shift_y)
+
     # Shift along x-axis of local reference frame
     x = x + np.cos(alpha_x) * shift_x
     y = y + np.sin(alpha_x) * shift_x
@@ -119,9 +250,10 @@ def apply_shifts(x: float,
     return x_adj, y_adj
 
 
-def add_zero_element(df: pd.DataFrame,
+def add_zero_element(df: 'pd.DataFrame',
                      dataset: DataSet,
-                     i: int) -> None:
+                     i: int,
+                     profile: 'VehicleProfile | None' = None) -> None:
     """
     Adds zero element to the dataset wihtout corections
 
@@ -135,18 +267,24 @@ def add_zero_element(df: pd.DataFrame,
 
     i: int
         The step of iteration
+
+    profile: VehicleProfile, optional
+        Installation geometry of GNSS module. Height of 1500 mm
+        without lever arm by default
     """
 
     curr_row = df.iloc[i]
-    shift_x, shift_y = caluclate_shifts(curr_row['roll_deg'],
-                                        curr_row['pitch_deg'])
+    shift_x, shift_y = profile_shifts(curr_row['roll_deg'],
+                                      curr_row['pitch_deg'],
+                                      profile)
     dataset.add_data(*curr_row[:5],
                      shift=(shift_x, shift_y))
 
 
-def add_first_element(df: pd.DataFrame,
+def add_first_element(df: 'pd.DataFrame',
                       dataset: DataSet,
-                      i: int) -> None:
+                      i: int,
+                      profile: 'VehicleProfile | None' = None) -> None:
     """
     Adds first elements to the dataset
     Makes correction for zero and first elements
@@ -161,6 +299,10 @@ def add_first_element(df: pd.DataFrame,
 
     i: int
         The step of iteration
+
+    profile: VehicleProfile, optional
+        Installation geometry of GNSS module. Height of 1500 mm
+        without lever arm by default
     """
 
     prev_row = df.iloc[i-1]
@@ -171,8 +313,9 @@ def add_first_element(df: pd.DataFrame,
                                       curr_row.x_mm,
                                       curr_row.y_mm)
     # Calculate the shift for current row
-    shift_x, shift_y = caluclate_shifts(curr_row.roll_deg,
-                                        curr_row.pitch_deg)
+    shift_x, shift_y = profile_shifts(curr_row.roll_deg,
+                                      curr_row.pitch_deg,
+                                      profile)
     # Apply shift to current row
     x_adj, y_adj = apply_shifts(curr_row.x_mm,
                                 curr_row.y_mm,
@@ -195,11 +338,13 @@ def add_first_element(df: pd.DataFrame,
     dataset.adj_y[i-1] = y_adj_prev
 
 
-def recalc_prev_elements(df: pd.DataFrame,
+def recalc_prev_elements(df: 'pd.DataFrame',
                          dataset: DataSet,
                          correct_alpha_x: float,
                          correct_alpha_y: float,
-                         i: int) -> None:
+                         i: int,
+                         window: int | None = None,
+                         profile: 'VehicleProfile | None' = None) -> None:
     """
     Recalualtes position for the previous points
 
@@ -219,11 +364,19 @@ def recalc_prev_elements(df: pd.DataFrame,
 
     i: int
         The step of iteration
+
+    window: int, optional
+        Number of previous points to recalculate. All points by default
+
+    profile: VehicleProfile, optional
+        Installation geometry of GNSS module. Height of 1500 mm
+        without lever arm by default
     """
 
     alpha_x, alpha_y = correct_alpha_x, correct_alpha_y
+    first = 0 if window is None else max(0, i - window)
 
-    for j in reversed(range(1, i)):
+    for j in reversed(range(max(1, first), i)):
         prev_row = df.iloc[j-1]
         curr_row = df.iloc[j]
         # Get the shifts
@@ -241,7 +394,7 @@ def recalc_prev_elements(df: pd.DataFrame,
         # Those are the angles between current and next points
         dataset.angle[j] = (alpha_x, alpha_y)
         # Make a rollback (take roll from previous point)
-        y_shift = calculate_backroll(dataset.roll_deg[j-1])
+        y_shift = profile_backroll(dataset.roll_deg[j-1], profile)
         x_curr_adj, y_curr_adj = apply_shifts(dataset.adj_x[j],
                                               dataset.adj_y[j],
                                               alpha_x=dataset.angle[j][0],
@@ -252,6 +405,8 @@ def recalc_prev_elements(df: pd.DataFrame,
                                           prev_row.y_mm,
                                           x_curr_adj,
                                           y_curr_adj)
+    if first > 0:
+        return
     # Update separately for t=0
     # Update the angle
     dataset.angle[0] = (alpha_x, alpha_y)  # type: ignore
@@ -266,11 +421,14 @@ def recalc_prev_elements(df: pd.DataFrame,
     dataset.adj_x[0], dataset.adj_y[0] = x_adj, y_adj
 
 
-def correct_point(df: pd.DataFrame,
+def correct_point(df: 'pd.DataFrame',
                   dataset: DataSet,
                   i: int,
                   flag: bool,
-                  recalc=True) -> bool:
+                  recalc=True,
+                  recalc_window: int | None = None,
+                  stats: Instrumentation | None = None,
+                  profile: 'VehicleProfile | None' = None) -> bool:
     """
     Calculates the angle between previous point (adjusted to the same roll
     as current) and current point
@@ -299,6 +457,16 @@ def correct_point(df: pd.DataFrame,
         recalculate previous points' coordinates after
         encountering points with the same roll
 
+    recalc_window: int, optional
+        Number of previous points to recalculate. All points by default
+
+    stats: Instrumentation, optional
+        Collects timings of the stages and branch counters
+
+    profile: VehicleProfile, optional
+        Installation geometry of GNSS module. Height of 1500 mm
+        without lever arm by default
+
     Returns
     ----------
     flag: bool
@@ -308,6 +476,8 @@ def correct_point(df: pd.DataFrame,
 
     prev_row = df.iloc[i-1]
     curr_row = df.iloc[i]
+    if stats is not None:
+        stats.lap('row_access')
 
     if (curr_row.roll_deg == prev_row.roll_deg) & (flag):
         # Calculate correct angle
@@ -317,27 +487,41 @@ def correct_point(df: pd.DataFrame,
                                           curr_row.y_mm)
 
         # Update the points for current row
-        shift_x, shift_y = caluclate_shifts(curr_row.roll_deg,
-                                            curr_row.pitch_deg)
+        shift_x, shift_y = profile_shifts(curr_row.roll_deg,
+                                          curr_row.pitch_deg,
+                                          profile)
         x_adj, y_adj = apply_shifts(curr_row.x_mm,
                                     curr_row.y_mm,
                                     alpha_x,
                                     alpha_y,
                                     shift_x,
                                     shift_y)
+        if stats is not None:
+            stats.lap('trig')
         dataset.add_data(*curr_row[:5],
                          angle=(alpha_x, alpha_y),
                          shift=(shift_x, shift_y),
                          adj_x=x_adj,
                          adj_y=y_adj)
+        if stats is not None:
+            stats.lap('add_data')
+            stats.count('equal_roll')
 
         if recalc:
-            recalc_prev_elements(df, dataset, alpha_x, alpha_y, i)
+            recalc_prev_elements(df, dataset, alpha_x, alpha_y, i,
+                                 window=recalc_window,
+                                 profile=profile)
+            if stats is not None:
+                first = (0 if recalc_window is None
+                         else max(0, i - recalc_window))
+                stats.lap('recalc')
+                stats.count('recalc_passes')
+                stats.count('recalc_points', i - first)
         flag = False
 
     else:
         # Get unrolled previous point
-        y_shift = calculate_backroll(curr_row.roll_deg)
+        y_shift = profile_backroll(curr_row.roll_deg, profile)
         x_prev_adj, y_prev_adj = apply_shifts(dataset.adj_x[i-1],
                                               dataset.adj_y[i-1],
                                               alpha_x=dataset.angle[i-1][0],
@@ -349,8 +533,9 @@ def correct_point(df: pd.DataFrame,
                                           curr_row.x_mm,
                                           curr_row.y_mm)
         # Calculate the shift
-        shift_x, shift_y = caluclate_shifts(curr_row.roll_deg,
-                                            curr_row.pitch_deg)
+        shift_x, shift_y = profile_shifts(curr_row.roll_deg,
+                                          curr_row.pitch_deg,
+                                          profile)
         # Make the shift
         x_adj, y_adj = apply_shifts(curr_row.x_mm,
                                     curr_row.y_mm,
@@ -358,19 +543,27 @@ def correct_point(df: pd.DataFrame,
                                     alpha_y,
                                     shift_x,
                                     shift_y)
+        if stats is not None:
+            stats.lap('trig')
         # Record the changes
         dataset.add_data(*curr_row[:5],
                          angle=(alpha_x, alpha_y),
                          shift=(shift_x, shift_y),
                          adj_x=x_adj,
                          adj_y=y_adj)
+        if stats is not None:
+            stats.lap('add_data')
+            stats.count('backroll')
 
     return flag
 
 
-def transfrom(df: pd.DataFrame,
+def transfrom(df: 'pd.DataFrame',
               dataset: DataSet,
-              recalc: bool = True) -> None:
+              recalc: bool = True,
+              recalc_window: int | None = None,
+              stats: Instrumentation | None = None,
+              profile: 'VehicleProfile | None' = None) -> None:
     """
     Iterates over the whole dataset imitating real time retrieval of data
     Updates points coordinates and calculates angles on the fly
@@ -383,14 +576,45 @@ def transfrom(df: pd.DataFrame,
 
     dataset: DataSet
         Instance of class DataSet where the data will be stored
+
+    recalc: bool, default = True
+        recalculate previous points' coordinates after
+        encountering points with the same roll
+
+    recalc_window: int, optional
+        Number of previous points to recalculate. Bounds the work of
+        the recalculation pass. All points by default
+
+    stats: Instrumentation, optional
+        Collects timings of the stages, branch counters and size of
+        the recalculation pass, see `Instrumentation`
+
+    profile: VehicleProfile, optional
+        Installation geometry of GNSS module. Height of 1500 mm
+        without lever arm by default
     """
 
     flag = True
-
-    for i in range(len(df)):
-        if i == 0:
-            add_zero_element(df, dataset, i)
-        if i == 1:
-            add_first_element(df, dataset, i)
-        if i not in [0, 1]:
-            flag = correct_point(df, dataset, i, flag, recalc=recalc)
+    if stats is not None:
+        stats.start()
+
+    try:
+        for i in range(len(df)):
+            if i == 0:
+                add_zero_element(df, dataset, i, profile)
+            if i == 1:
+                add_first_element(df, dataset, i, profile)
+            if i not in [0, 1]:
+                flag = correct_point(df, dataset, i, flag,
+                                     recalc=recalc,
+                                     recalc_window=recalc_window,
+                                     stats=stats,
+                                     profile=profile)
+            elif stats is not None:
+                stats.lap('setup')
+        if stats is not None:
+            stats.count('fixes', len(df))
+    finally:
+        # The profiler is disabled even if the correction fails
+        if stats is not None:
+            stats.stop()
@@ -0,0 +1,296 @@
+from collections import OrderedDict
+from dataclasses import replace
+from math import nan
+import os
+from typing import TYPE_CHECKING
+
+import numpy as np
+from src.data.make_dataset import ColumnarDataSet
+from src.data.storage import load_npy, time_slice
+from src.functions.parallel import seed_state
+from src.functions.profile import VehicleProfile
+from src.functions.shift_table import ShiftTable
+from src.functions.streaming import CorrectorState
+from src.functions.vectorized import (adjust,
+                                      as_column,
+                                      backward_kernel,
+                                      column_shifts,
+                                      forward_kernel,
+                                      recalc_first)
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+INPUT_COLUMNS = ('time_s', 'x_mm', 'y_mm', 'roll_deg', 'pitch_deg')
+# Rows per block and number of blocks kept by default
+BLOCK = 65_536
+CACHE_BLOCKS = 16
+
+
+class LazyTrack:
+    """
+    Corrected view of a log computed on demand. Only the blocks
+    of rows touched by a query are corrected; results are identical
+    to `transfrom_arrays`.
+
+    The state of the corrector before every block reached so far is
+    kept as a checkpoint, so a block is corrected from the nearest
+    checkpoint before it, and corrected blocks are memoized with
+    LRU eviction. Checkpoints take a few numbers per block, so after
+    the first pass over a log any slice costs O(slice).
+
+    With `warmup` a block far from the checkpoints is corrected from
+    a state guessed from the raw track `warmup` rows before it instead
+    of correcting all rows since the nearest checkpoint, see
+    `transfrom_arrays_parallel`. The guess converges to the exact
+    angles within tens of rows, but unlike the checkpoints
+    it is not verified.
+
+    Methods
+    ----------
+    slice(start: int, stop: int) -> dict[str, np.ndarray]
+        Corrected columns of rows start...stop - 1
+
+    window(start: float, stop: float) -> dict[str, np.ndarray]
+        Corrected columns of rows with start <= time_s < stop
+
+    from_npy(path: str | os.PathLike, **kwargs) -> LazyTrack
+        View over a log saved by `save_npy`, memory-mapped
+
+    from_frame(df: pd.DataFrame, **kwargs) -> LazyTrack
+        View over a dataframe
+    """
+
+    def __init__(self,
+                 time_s,
+                 x_mm,
+                 y_mm,
+                 roll_deg,
+                 pitch_deg,
+                 recalc: bool = True,
+                 recalc_window: int | None = None,
+                 block: int = BLOCK,
+                 cache_blocks: int = CACHE_BLOCKS,
+                 warmup: int | None = None,
+                 shift_table: ShiftTable | None = None,
+                 profile: VehicleProfile | None = None) -> None:
+        """
+        Parameters
+        ----------
+        time_s, x_mm, y_mm, roll_deg, pitch_deg: array-like
+            Columns of the initial data, e.g. memory-mapped arrays.
+            Time is expected in ascending order for `window`
+
+        recalc: bool, default = True
+            recalculate previous points' coordinates after
+            encountering points with the same roll
+
+        recalc_window: int, optional
+            Number of previous points to recalculate. All points
+            by default
+
+        block: int, default = BLOCK
+            Number of rows corrected at once
+
+        cache_blocks: int, default = CACHE_BLOCKS
+            Number of corrected blocks kept in memory
+
+        warmup: int, optional
+            Number of rows corrected from a guessed state before a block
+            far from the checkpoints. Blocks are corrected from the exact
+            state by default
+
+        shift_table: ShiftTable, optional
+            Lookup table for shifts of quantized roll and pitch
+
+        profile: VehicleProfile, optional
+            Installation geometry of GNSS module
+        """
+
+        if block < 2:
+            raise ValueError('block must be at least 2 rows')
+
+        self.columns = {'time_s': as_column(time_s),
+                        'x_mm': as_column(x_mm),
+                        'y_mm': as_column(y_mm),
+                        'roll_deg': as_column(roll_deg),
+                        'pitch_deg': as_column(pitch_deg)}
+        self.recalc = recalc
+        self.recalc_window = recalc_window
+        self.block = block
+        self.cache_blocks = cache_blocks
+        self.warmup = warmup
+        self.shift_table = shift_table
+        self.profile = profile
+
+        self.checkpoints: dict[int, CorrectorState] = {0: CorrectorState()}
+        self.cache: OrderedDict[int, dict[str, np.ndarray]] = OrderedDict()
+        self.hits = self.misses = 0
+        self._anchor: int | None = None
+        self._recalculated: np.ndarray | None = None
+
+    @classmethod
+    def from_npy(cls, path: str | os.PathLike, **kwargs) -> 'LazyTrack':
+        columns = load_npy(path, list(INPUT_COLUMNS))
+        return cls(*(columns[name] for name in INPUT_COLUMNS), **kwargs)
+
+    @classmethod
+    def from_frame(cls, df: 'pd.DataFrame', **kwargs) -> 'LazyTrack':
+        return cls(*(df[name] for name in INPUT_COLUMNS), **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.columns['time_s'])
+
+    @property
+    def anchor(self) -> int:
+        """
+        Index of the first point with the same roll as the previous one
+        (not earlier than the third point), -1 if there is none.
+        Roll is scanned block by block only up to the anchor
+        """
+
+        if self._anchor is None:
+            roll = self.columns['roll_deg']
+            self._anchor = -1
+            for a in range(1, len(self) - 1, self.block):
+                chunk = roll[a:a+self.block+1]
+                same = np.flatnonzero(chunk[1:] == chunk[:-1])
+                if len(same):
+                    self._anchor = a + int(same[0]) + 1
+                    break
+        return self._anchor
+
+    def _shifts(self, a: int, b: int) -> tuple[np.ndarray, np.ndarray]:
+        return column_shifts(self.columns['roll_deg'][a:b],
+                             self.columns['pitch_deg'][a:b],
+                             self.shift_table, self.profile)
+
+    def _forward(self, a: int, b: int, state: CorrectorState) -> list:
+        """
+        Calculates angles of rows a...b - 1 from the state before them,
+        the state is updated in place
+        """
+
+        shift_x, shift_y = self._shifts(a, b)
+        angles = [nan] * (b - a)
+        forward_kernel(self.columns['x_mm'][a:b].tolist(),
+                       self.columns['y_mm'][a:b].tolist(),
+                       self.columns['roll_deg'][a:b].tolist(),
+                       shift_x.tolist(), shift_y.tolist(),
+                       (-shift_y).tolist(), angles, state)
+        return angles
+
+    def _state(self, k: int) -> tuple[CorrectorState, bool]:
+        """
+        Returns a copy of the state before block k and whether it is
+        exact. Checkpoints of the blocks passed on the way from
+        the nearest one are kept
+        """
+
+        start = max(j for j in self.checkpoints if j <= k)
+        a = k * self.block
+        if (self.warmup is not None
+                and a - start * self.block > self.warmup
+                and a - self.warmup >= 2):
+            first = a - self.warmup
+            x, y, roll = (self.columns[name][first-2:first].tolist()
+                          for name in ('x_mm', 'y_mm', 'roll_deg'))
+            shift_x, shift_y = self._shifts(first - 2, first)
+            # The two rows before `first` are rows 0 and 1 of the lists,
+            # so the track begins at 2 - first
+            state = seed_state(x, y, roll, shift_x.tolist(),
+                               shift_y.tolist(), 2, self.anchor, 2 - first)
+            self._forward(first, a, state)
+            return state, False
+
+        state = replace(self.checkpoints[start])
+        for j in range(start, k):
+            self._forward(j * self.block, (j + 1) * self.block, state)
+            self.checkpoints[j+1] = replace(state)
+        return state, True
+
+    def _recalculated_angles(self) -> np.ndarray:
+        """
+        Angles of rows from the first recalculated one to the anchor
+        (excluded) given by the recalculation pass
+        """
+
+        if self._recalculated is None:
+            anchor = self.anchor
+            first = recalc_first(anchor, self.recalc_window)
+            k = anchor // self.block
+            state, _ = self._state(k)
+            alpha = self._forward(k * self.block, anchor + 1, state)[-1]
+
+            angles = [nan] * (anchor - first) + [alpha]
+            shift_x, shift_y = self._shifts(first, anchor + 1)
+            backward_kernel(self.columns['x_mm'][first:anchor+1].tolist(),
+                            self.columns['y_mm'][first:anchor+1].tolist(),
+                            shift_x.tolist(), shift_y.tolist(),
+                            (-shift_y).tolist(), angles, anchor - first)
+            self._recalculated = np.array(angles[:-1], dtype=np.float64)
+        return self._recalculated
+
+    def block_columns(self, k: int) -> dict[str, np.ndarray]:
+        """
+        Returns corrected columns of block k, from the cache if possible
+        """
+
+        columns = self.cache.get(k)
+        if columns is not None:
+            self.cache.move_to_end(k)
+            self.hits += 1
+            return columns
+
+        self.misses += 1
+        a, b = k * self.block, min((k + 1) * self.block, len(self))
+        state, exact = self._state(k)
+        columns = {name: values[a:b]
+                   for name, values in self.columns.items()}
+        columns['shift_x'], columns['shift_y'] = self._shifts(a, b)
+        columns['angle_x'] = np.array(self._forward(a, b, state),
+                                      dtype=np.float64)
+        if exact and b < len(self):
+            self.checkpoints.setdefault(k + 1, state)
+
+        anchor = self.anchor
+        if self.recalc and anchor > 0:
+            first = recalc_first(anchor, self.recalc_window)
+            lo, hi = max(first, a), min(anchor, b)
+            if lo < hi:
+                columns['angle_x'][lo-a:hi-a] = (
+                    self._recalculated_angles()[lo-first:hi-first])
+        adjust(columns)
+
+        self.cache[k] = columns
+        if len(self.cache) > self.cache_blocks:
+            self.cache.popitem(last=False)
+        return columns
+
+    def slice(self, start: int, stop: int) -> dict[str, np.ndarray]:
+        """
+        Returns corrected columns (named as ColumnarDataSet.COLUMNS)
+        of rows start...stop - 1
+        """
+
+        start, stop, _ = slice(start, stop).indices(len(self))
+        if start >= stop:
+            return {name: np.empty(0) for name in ColumnarDataSet.COLUMNS}
+
+        offset = start // self.block * self.block
+        blocks = [self.block_columns(k)
+                  for k in range(start // self.block,
+                                 -(-stop // self.block))]
+
+        return {name: np.concatenate([columns[name] for columns in blocks]
+                                     )[start-offset:stop-offset]
+                for name in ColumnarDataSet.COLUMNS}
+
+    def window(self, start: float, stop: float) -> dict[str, np.ndarray]:
+        """
+        Returns corrected columns of rows with start <= time_s < stop.
+        Rows are found by binary search over time
+        """
+
+        rows = time_slice(self.columns['time_s'], start, stop)
+        return self.slice(rows.start, rows.stop)
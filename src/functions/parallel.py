@@ -0,0 +1,355 @@
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import replace
+from math import atan2, nan
+from typing import TYPE_CHECKING, Mapping
+
+import numpy as np
+from src.data.make_dataset import DataSet, ColumnarDataSet
+from src.functions import scalar
+from src.functions.profile import VehicleProfile
+from src.functions.shift_table import ShiftTable
+from src.functions.streaming import CorrectorState
+from src.functions.vectorized import (as_column,
+                                      adjust,
+                                      backward_kernel,
+                                      column_shifts,
+                                      forward_kernel,
+                                      recalc_first,
+                                      store_columns,
+                                      track_order)
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Segments shorter than this are not worth a separate process
+MIN_SEGMENT = 50_000
+
+
+def find_anchor(roll_deg: np.ndarray) -> int:
+    """
+    Returns index of the first point with the same roll as the previous
+    one (not earlier than the third point), -1 if there is none.
+    Only this point is corrected from the raw coordinates, see
+    `correct_point`
+    """
+
+    same = np.flatnonzero(roll_deg[2:] == roll_deg[1:-1])
+    return int(same[0]) + 2 if len(same) else -1
+
+
+def seed_state(x: list,
+               y: list,
+               roll: list,
+               shift_x: list,
+               shift_y: list,
+               start: int,
+               anchor: int,
+               first: int = 0) -> CorrectorState:
+    """
+    Guesses the state before point `start` of the track beginning
+    at `first` from raw coordinates: the angle of the previous point
+    is taken along the raw track. `anchor` is counted from `first`
+    """
+
+    alpha = atan2(y[start-1] - y[start-2], x[start-1] - x[start-2])
+    adj_x, adj_y = scalar.apply_shifts(x[start-1], y[start-1],
+                                       alpha, alpha + scalar.HALF_PI,
+                                       shift_x[start-1], shift_y[start-1])
+    count = start - first
+    return CorrectorState(count=count,
+                          x_mm=x[start-1],
+                          y_mm=y[start-1],
+                          roll_deg=roll[start-1],
+                          shift_x=shift_x[start-1],
+                          shift_y=shift_y[start-1],
+                          angle_x=alpha,
+                          adj_x=adj_x,
+                          adj_y=adj_y,
+                          flag=not 0 <= anchor < count,
+                          anchor=anchor if 0 <= anchor < count else -1)
+
+
+def speculate(pieces: list[tuple]) -> list[tuple[list, CorrectorState]]:
+    """
+    Runs `forward_kernel` over pieces of tracks
+    (x, y, roll, shift_x, shift_y, backroll, state), each from its
+    exact or guessed state. Called in worker processes
+    """
+
+    results = []
+    for x, y, roll, shift_x, shift_y, backroll, state in pieces:
+        angles = [nan] * len(x)
+        forward_kernel(x, y, roll, shift_x, shift_y, backroll, angles,
+                       state)
+        results.append((angles, state))
+    return results
+
+
+def plan_jobs(bounds: list[int],
+              workers: int,
+              min_segment: int) -> list[list[tuple[int, int, int]]]:
+    """
+    Splits tracks [bounds[t], bounds[t+1]) into pieces (t, start, stop)
+    of about 1 / workers of all points, but not shorter than
+    `min_segment`, and groups consecutive pieces into jobs of about
+    the same size
+    """
+
+    length = max(min_segment, 3, -(-bounds[-1] // workers))
+    jobs, size = [[]], 0
+
+    for t, (a, b) in enumerate(zip(bounds, bounds[1:])):
+        cuts = np.linspace(a, b, max(1, (b - a) // length) + 1)
+        cuts = cuts.astype(int).tolist()
+        for start, stop in zip(cuts, cuts[1:]):
+            if size >= length:
+                jobs.append([])
+                size = 0
+            jobs[-1].append((t, start, stop))
+            size += stop - start
+
+    return jobs if jobs[0] else []
+
+
+def fix_up(x: list,
+           y: list,
+           roll: list,
+           shift_x: list,
+           shift_y: list,
+           backroll: list,
+           angles: list,
+           state: CorrectorState,
+           start: int,
+           stop: int,
+           block: int = 256) -> bool:
+    """
+    Recalculates angles of a speculated segment [start, stop) from
+    the exact state until an angle equals the speculated one.
+    The angle is the whole state of the recurrence, so from that point
+    the speculated angles are exact.
+
+    Returns True if the speculation converged inside the segment,
+    otherwise the whole segment is recalculated and `state` is exact
+    at its end
+    """
+
+    i = start
+    while i < stop:
+        j = min(i + block, stop)
+        exact = [nan] * (j - i)
+        forward_kernel(x[i:j], y[i:j], roll[i:j], shift_x[i:j],
+                       shift_y[i:j], backroll[i:j], exact, state)
+        for k, alpha in enumerate(exact):
+            if alpha == angles[i+k]:
+                angles[i:i+k] = exact[:k]
+                return True
+        angles[i:j] = exact
+        i = j
+    return False
+
+
+def transfrom_arrays_parallel(time_s,
+                              x_mm,
+                              y_mm,
+                              roll_deg,
+                              pitch_deg,
+                              recalc: bool = True,
+                              recalc_window: int | None = None,
+                              workers: int | None = None,
+                              min_segment: int = MIN_SEGMENT,
+                              shift_table: ShiftTable | None = None,
+                              executor: Executor | None = None,
+                              profile: VehicleProfile | Mapping | None = None,
+                              vehicle_id=None) -> dict[str, np.ndarray]:
+    """
+    Version of `transfrom_arrays` correcting tracks on several
+    cores. Results are identical to `transfrom_arrays`.
+
+    Every angle depends on the previous adjusted point, so a long
+    track is split into segments which are corrected in parallel from
+    a guessed state (angle of the raw track before the segment).
+    Then the segments are fixed up one after another: the recurrence
+    is recalculated from the exact state only until it reaches
+    the same angle as the guess, which usually takes a few tens of
+    points. Tracks of different vehicles are independent and need
+    no fix up, short ones are corrected together in one process.
+    Recalculation of the points before the anchor is done
+    in the main process.
+
+    Parameters
+    ----------
+    time_s, x_mm, y_mm, roll_deg, pitch_deg: array-like
+        Columns of the initial data
+
+    recalc: bool, default = True
+        recalculate previous points' coordinates after
+        encountering points with the same roll
+
+    recalc_window: int, optional
+        Number of previous points to recalculate. All points by default
+
+    workers: int, optional
+        Number of processes. os.cpu_count() by default
+
+    min_segment: int, default = MIN_SEGMENT
+        Minimal number of points in a segment
+
+    shift_table: ShiftTable, optional
+        Lookup table for shifts of quantized roll and pitch
+
+    executor: Executor, optional
+        Pool to run segments in, e.g. to reuse it for several tracks.
+        A new ProcessPoolExecutor by default
+
+    profile: VehicleProfile or Mapping[Hashable, VehicleProfile], optional
+        Installation geometry of GNSS module. With `vehicle_id`
+        a mapping of profiles of the vehicles
+
+    vehicle_id: array-like, optional
+        Vehicle of each fix. Fixes of every vehicle are corrected as
+        a separate track, the results keep the order of the rows
+
+    Returns
+    ----------
+    columns: dict[str, np.ndarray]
+        Same as `transfrom_arrays`
+    """
+
+    columns = {'time_s': as_column(time_s),
+               'x_mm': as_column(x_mm),
+               'y_mm': as_column(y_mm),
+               'roll_deg': as_column(roll_deg),
+               'pitch_deg': as_column(pitch_deg)}
+    n = len(columns['time_s'])
+
+    shift_x, shift_y = column_shifts(columns['roll_deg'],
+                                     columns['pitch_deg'],
+                                     shift_table, profile, vehicle_id)
+    columns['shift_x'], columns['shift_y'] = shift_x, shift_y
+
+    if vehicle_id is None:
+        order, bounds = np.arange(n), [0, n]
+    else:
+        order, bounds, _ = track_order(vehicle_id)
+    roll_sorted = columns['roll_deg'][order]
+    x, y, roll, sx, sy, back = (
+        column.tolist() for column in
+        (columns['x_mm'][order], columns['y_mm'][order], roll_sorted,
+         shift_x[order], shift_y[order], -shift_y[order]))
+    anchors = [find_anchor(roll_sorted[a:b])
+               for a, b in zip(bounds, bounds[1:])]
+
+    def pieces(job):
+        for t, a, b in job:
+            state = (CorrectorState() if a == bounds[t] else
+                     seed_state(x, y, roll, sx, sy, a, anchors[t],
+                                bounds[t]))
+            yield (x[a:b], y[a:b], roll[a:b], sx[a:b], sy[a:b], back[a:b],
+                   state)
+
+    workers = os.cpu_count() or 1 if workers is None else workers
+    jobs = plan_jobs(bounds, workers, min_segment)
+
+    # Other jobs are speculated in workers meanwhile the first one
+    # is corrected here
+    pool, futures = None, []
+    if len(jobs) > 1:
+        pool = executor or ProcessPoolExecutor(
+            max_workers=min(workers, len(jobs) - 1))
+        futures = [pool.submit(speculate, list(pieces(job)))
+                   for job in jobs[1:]]
+
+    angles = [nan] * n
+    try:
+        results = [speculate(list(pieces(jobs[0])))] if jobs else []
+        results.extend(future.result() for future in futures)
+    finally:
+        if pool is not None and executor is None:
+            pool.shutdown(cancel_futures=True)
+
+    state = None
+    for job, job_results in zip(jobs, results):
+        for (t, a, b), (segment, end) in zip(job, job_results):
+            angles[a:b] = segment
+            if a == bounds[t]:
+                state = end
+            else:
+                exact = replace(state)
+                # If the guess converged the state at the end
+                # of the segment (including the anchor found there)
+                # is exact
+                state = end if fix_up(x, y, roll, sx, sy, back, angles,
+                                      exact, a, b) else exact
+
+            if b == bounds[t+1] and recalc and anchors[t] > 0:
+                first = bounds[t]
+                track = angles[first:b]
+                backward_kernel(x[first:b], y[first:b], sx[first:b],
+                                sy[first:b], back[first:b], track,
+                                anchors[t],
+                                recalc_first(anchors[t], recalc_window))
+                angles[first:b] = track
+
+    columns['angle_x'] = np.empty(n, dtype=np.float64)
+    columns['angle_x'][order] = angles
+    adjust(columns)
+
+    return columns
+
+
+def transfrom_parallel(df: 'pd.DataFrame',
+                       dataset: DataSet | ColumnarDataSet,
+                       recalc: bool = True,
+                       recalc_window: int | None = None,
+                       workers: int | None = None,
+                       min_segment: int = MIN_SEGMENT,
+                       profile: VehicleProfile | Mapping | None = None,
+                       vehicle_column: str | None = None) -> None:
+    """
+    Parallel replacement for `transfrom` for long tracks,
+    see `transfrom_arrays_parallel`
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Initial pandas DataFrame
+
+    dataset: DataSet or ColumnarDataSet
+        Instance of class DataSet where the data will be stored
+
+    recalc: bool, default = True
+        recalculate previous points' coordinates after
+        encountering points with the same roll
+
+    recalc_window: int, optional
+        Number of previous points to recalculate. All points by default
+
+    workers: int, optional
+        Number of processes. os.cpu_count() by default
+
+    min_segment: int, default = MIN_SEGMENT
+        Minimal number of points in a segment
+
+    profile: VehicleProfile or Mapping[Hashable, VehicleProfile], optional
+        Installation geometry of GNSS module, a mapping of profiles
+        of the vehicles with `vehicle_column`
+
+    vehicle_column: str, optional
+        Column with vehicle IDs for logs of several vehicles
+    """
+
+    columns = transfrom_arrays_parallel(df['time_s'],
+                                        df['x_mm'],
+                                        df['y_mm'],
+                                        df['roll_deg'],
+                                        df['pitch_deg'],
+                                        recalc=recalc,
+                                        recalc_window=recalc_window,
+                                        workers=workers,
+                                        min_segment=min_segment,
+                                        profile=profile,
+                                        vehicle_id=(
+                                            None if vehicle_column is None
+                                            else df[vehicle_column]))
+    store_columns(columns, dataset)
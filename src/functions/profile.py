@@ -0,0 +1,140 @@
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Hashable, Mapping
+
+import numpy as np
+from src.functions.functions import caluclate_shifts
+from src.functions.shift_table import (DEFAULT_HEIGHT,
+                                      ShiftTable,
+                                      shared_table)
+
+
+@dataclass(frozen=True)
+class VehicleProfile:
+    """
+    Installation geometry of GNSS module on a vehicle
+
+    Shifts along the axes of local reference frame are
+        shift_x = sign_x * |height * cos(roll) * sin(pitch)| + lever_x
+        shift_y = sign_y * |height * sin(roll)| + lever_y
+    The default profile gives the same shifts as `caluclate_shifts`
+
+    Attributes
+    ---------
+    height: float, default = 1500
+        Height of GNSS module installation in mm
+
+    lever_x, lever_y: float, default = 0
+        Longitudinal and lateral offset of the module from the point
+        being tracked in mm
+
+    sign_x, sign_y: int, default = 1
+        Direction of the tilt shifts along x' and y' axes (1 or -1)
+
+    Methods
+    ----------
+    shift(roll_deg: float, pitch_deg: float) -> tuple[float, float]
+        Shifts for a single fix
+
+    shifts(roll_deg: np.ndarray,
+           pitch_deg: np.ndarray) -> tuple[np.ndarray, np.ndarray]
+        Shifts for arrays of fixes
+    """
+
+    height: float = DEFAULT_HEIGHT
+    lever_x: float = 0.0
+    lever_y: float = 0.0
+    sign_x: int = 1
+    sign_y: int = 1
+
+    def __post_init__(self) -> None:
+        if self.sign_x not in (1, -1) or self.sign_y not in (1, -1):
+            raise ValueError('sign_x and sign_y must be 1 or -1')
+
+    @property
+    def table(self) -> ShiftTable:
+        """
+        Lookup table of tilt shifts for the height, shared by
+        the profiles of the same height (see `shared_table`)
+        """
+
+        return shared_table(self.height)
+
+    @cached_property
+    def plain(self) -> bool:
+        """
+        True if shifts are just the tilt shifts (no lever arm and signs)
+        """
+
+        return (self.lever_x == 0 and self.lever_y == 0
+                and self.sign_x == 1 and self.sign_y == 1)
+
+    def params(self) -> tuple[float, float, float, int, int]:
+        return (self.height, self.lever_x, self.lever_y,
+                self.sign_x, self.sign_y)
+
+    def shift(self, roll_deg: float, pitch_deg: float) -> tuple[float, float]:
+        """
+        Calculates shifts for a single fix
+        """
+
+        shift_x, shift_y = self.table.shift(roll_deg, pitch_deg)
+        if self.plain:
+            return shift_x, shift_y
+        return (self.sign_x * shift_x + self.lever_x,
+                self.sign_y * shift_y + self.lever_y)
+
+    def shifts(self,
+               roll_deg: np.ndarray,
+               pitch_deg: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Calculates shifts for arrays of fixes
+        """
+
+        shift_x, shift_y = self.table.shifts(roll_deg, pitch_deg)
+        if self.plain:
+            return shift_x, shift_y
+        return (self.sign_x * shift_x + self.lever_x,
+                self.sign_y * shift_y + self.lever_y)
+
+
+def fleet_shifts(roll_deg: np.ndarray,
+                 pitch_deg: np.ndarray,
+                 vehicle_id: np.ndarray,
+                 profiles: Mapping[Hashable, VehicleProfile]
+                 ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Calculates shifts for fixes of several vehicles at once.
+    Parameters of the profiles are spread over the rows, so all fixes
+    are calculated with the same array operations
+
+    Parameters
+    ----------
+    roll_deg, pitch_deg: np.ndarray
+        Degrees of roll and pitch
+
+    vehicle_id: np.ndarray
+        Vehicle of each fix
+
+    profiles: Mapping[Hashable, VehicleProfile]
+        Profiles of the vehicles
+
+    Returns
+    ----------
+    shift_x, shift_y: np.ndarray
+        Shifts along the axes of local reference frame
+    """
+
+    ids, inverse = np.unique(np.asarray(vehicle_id), return_inverse=True)
+    missing = [vehicle for vehicle in ids.tolist() if vehicle not in profiles]
+    if missing:
+        raise KeyError(f'No profiles for vehicles {missing}')
+
+    params = np.array([profiles[vehicle].params() for vehicle in ids.tolist()],
+                      dtype=np.float64).reshape(-1, 5)
+    height, lever_x, lever_y, sign_x, sign_y = params[inverse.ravel()].T
+
+    shift_x, shift_y = caluclate_shifts(np.asarray(roll_deg, np.float64),
+                                        np.asarray(pitch_deg, np.float64),
+                                        height)
+    return sign_x * shift_x + lever_x, sign_y * shift_y + lever_y
@@ -0,0 +1,117 @@
+from math import atan2, cos, sin, radians, pi
+
+HALF_PI = pi / 2
+SCALARS = (int, float)
+
+
+def is_scalar(*values) -> bool:
+    """
+    Checks that all values are Python (or NumPy float64) numbers
+    """
+
+    for value in values:
+        if not isinstance(value, SCALARS):
+            return False
+    return True
+
+
+def calc_rot_angle(x0: float,
+                   y0: float,
+                   x1: float,
+                   y1: float) -> tuple[float, float]:
+    """
+    Scalar version of `functions.calc_rot_angle`
+    """
+
+    alpha_x = atan2(y1 - y0, x1 - x0)
+    return alpha_x, alpha_x + HALF_PI
+
+
+def caluclate_shifts(roll_deg: float,
+                     pitch_deg: float,
+                     height: float = 1500) -> tuple[float, float]:
+    """
+    Scalar version of `functions.caluclate_shifts`
+    """
+
+    height = float(height)
+    roll = radians(roll_deg)
+    y_shift = abs(height * sin(roll))
+    x_shift = abs(abs(height * cos(roll)) * sin(radians(pitch_deg)))
+    return x_shift, y_shift
+
+
+def calculate_backroll(roll_deg: float, height: float = 1500) -> float:
+    """
+    Scalar version of `functions.calculate_backroll`
+    """
+
+    return -abs(height * sin(radians(roll_deg)))
+
+
+def apply_shifts(x: float,
+                 y: float,
+                 alpha_x: float,
+                 alpha_y: float,
+                 shift_x: float = 0,
+                 shift_y: float = 0) -> tuple[float, float]:
+    """
+    Scalar version of `functions.apply_shifts`
+    """
+
+    x, y = float(x), float(y)
+    x_adj = x + cos(alpha_x) * shift_x + cos(alpha_y) * shift_y
+    y_adj = y + sin(alpha_x) * shift_x + sin(alpha_y) * shift_y
+    return x_adj, y_adj
+
+
+def rotate_and_shift(x0: float,
+                     y0: float,
+                     x1: float,
+                     y1: float,
+                     shift_x: float,
+                     shift_y: float) -> tuple[float, float, float, float]:
+    """
+    Calculates rotation angle between the points and shifts
+    the second point along the rotated axes in one call.
+    Same as `calc_rot_angle` followed by `apply_shifts`
+
+    Parameters
+    ----------
+    x0, y0: float
+        Coordinates of the point at time t-1
+
+    x1, y1: float
+        Coordinates of the point at time t
+
+    shift_x, shift_y: float
+        Shifts along axis of local reference frame
+
+    Returns
+    ----------
+    alpha_x, alpha_y: float
+        Angles of rotation to switch from global to local reference frame
+
+    x_adj, y_adj: float
+        Coordinates of the point at time t adjusted for tilt
+    """
+
+    x1, y1 = float(x1), float(y1)
+    alpha_x = atan2(y1 - y0, x1 - x0)
+    alpha_y = alpha_x + HALF_PI
+    x_adj = x1 + cos(alpha_x) * shift_x + cos(alpha_y) * shift_y
+    y_adj = y1 + sin(alpha_x) * shift_x + sin(alpha_y) * shift_y
+    return alpha_x, alpha_y, x_adj, y_adj
+
+
+def unroll(x_adj: float,
+           y_adj: float,
+           alpha_x: float,
+           shift_y: float) -> tuple[float, float]:
+    """
+    Moves adjusted point back along y-axis of local reference frame
+    by `shift_y` (roll of the next point, see `calculate_backroll`)
+    """
+
+    alpha_y = alpha_x + HALF_PI
+    return x_adj - cos(alpha_y) * shift_y, y_adj - sin(alpha_y) * shift_y
@@ -0,0 +1,154 @@
+from functools import lru_cache
+
+import numpy as np
+from src.functions.functions import caluclate_shifts
+
+DEFAULT_HEIGHT = 1500
+
+
+@lru_cache(maxsize=1)
+def unit_table(steps: int, limit: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Calculates sin and cos of the angles k / steps degrees
+    for k from -limit * steps to limit * steps
+
+    Grid values are calculated as k / steps, which gives exactly the same
+    float as parsing the quantized value (e.g. '3.92') from csv
+    """
+
+    grid = np.arange(-limit * steps, limit * steps + 1) / steps
+    radians = np.deg2rad(grid)
+    return np.sin(radians), np.cos(radians)
+
+
+@lru_cache(maxsize=8)
+def height_table(height: float,
+                 steps: int,
+                 limit: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Scales unit table by the height: |height * sin|, |height * cos|.
+    The tables for the last few heights are kept
+    """
+
+    sin, cos = unit_table(steps, limit)
+    return np.abs(height * sin), np.abs(height * cos)
+
+
+class ShiftTable:
+    """
+    Lookup table of shifts for roll and pitch quantized to a grid
+    (0.01 degree by default). Values outside the grid are calculated
+    with `caluclate_shifts`, so the results are always the same as
+    calculated directly.
+
+    Methods
+    ----------
+    shift(roll_deg: float, pitch_deg: float) -> tuple[float, float]
+        Shifts for a single fix
+
+    shifts(roll_deg: np.ndarray,
+           pitch_deg: np.ndarray) -> tuple[np.ndarray, np.ndarray]
+        Shifts for arrays of fixes
+
+    backroll(roll_deg: float | np.ndarray)
+        Backward shift along y-axis
+    """
+
+    __slots__ = ('height', 'steps', 'limit', '_offset',
+                 '_sin', '_h_sin', '_h_cos', '_roll', '_pitch')
+
+    def __init__(self,
+                 height: float = DEFAULT_HEIGHT,
+                 steps: int = 100,
+                 limit: int = 90) -> None:
+        """
+        Parameters
+        ----------
+        height: float
+            Height of GNSS module installation in mm.
+
+        steps: int, default = 100
+            Number of grid points per degree (100 for 0.01 degree)
+
+        limit: int, default = 90
+            Grid covers angles from -limit to limit degrees
+        """
+
+        self.height = height
+        self.steps = steps
+        self.limit = limit
+        self._offset = steps * limit
+        self._sin = unit_table(steps, limit)[0]
+        self._h_sin, self._h_cos = height_table(height, steps, limit)
+        # Dicts keyed by the grid values for single fixes: a value
+        # is found only if it is exactly on the grid
+        grid = (np.arange(-self._offset, self._offset + 1) / steps).tolist()
+        self._roll = dict(zip(grid, zip(self._h_sin.tolist(),
+                                        self._h_cos.tolist())))
+        self._pitch = dict(zip(grid, self._sin.tolist()))
+
+    def shift(self, roll_deg: float, pitch_deg: float) -> tuple[float, float]:
+        """
+        Calculates shifts for a single fix, see `caluclate_shifts`
+        """
+
+        roll = self._roll.get(roll_deg)
+        pitch = self._pitch.get(pitch_deg)
+
+        if roll is not None and pitch is not None:
+            return abs(roll[1] * pitch), roll[0]
+
+        x_shift, y_shift = caluclate_shifts(roll_deg, pitch_deg, self.height)
+        return float(x_shift), float(y_shift)
+
+    def shifts(self,
+               roll_deg: np.ndarray,
+               pitch_deg: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Calculates shifts for arrays of fixes, see `caluclate_shifts`
+        """
+
+        roll_deg = np.asarray(roll_deg, dtype=np.float64)
+        pitch_deg = np.asarray(pitch_deg, dtype=np.float64)
+        roll_k = np.rint(roll_deg * self.steps)
+        pitch_k = np.rint(pitch_deg * self.steps)
+        on_grid = ((roll_k / self.steps == roll_deg)
+                   & (pitch_k / self.steps == pitch_deg)
+                   & (np.abs(roll_k) <= self._offset)
+                   & (np.abs(pitch_k) <= self._offset))
+
+        roll_i = np.where(on_grid, roll_k, 0).astype(np.intp) + self._offset
+        pitch_i = np.where(on_grid, pitch_k, 0).astype(np.intp) + self._offset
+        y_shift = self._h_sin[roll_i]
+        x_shift = np.abs(self._h_cos[roll_i] * self._sin[pitch_i])
+
+        if not on_grid.all():
+            off_grid = ~on_grid
+            x_shift[off_grid], y_shift[off_grid] = caluclate_shifts(
+                roll_deg[off_grid], pitch_deg[off_grid], self.height)
+
+        return x_shift, y_shift
+
+    def backroll(self, roll_deg):
+        """
+        Calculates backward shift along y-axis, see `calculate_backroll`
+        """
+
+        roll = (self._roll.get(roll_deg)
+                if isinstance(roll_deg, (int, float)) else None)
+        if roll is not None:
+            return -roll[0]
+        if np.ndim(roll_deg):
+            return -self.shifts(roll_deg, np.zeros_like(roll_deg))[1]
+        return -self.shift(roll_deg, 0.0)[1]
+
+
+@lru_cache(maxsize=8)
+def shared_table(height: float = DEFAULT_HEIGHT) -> ShiftTable:
+    """
+    Returns lookup table for the height shared by all its users.
+    Like `height_table` only the tables for the last few heights
+    are kept
+    """
+
+    return ShiftTable(height)
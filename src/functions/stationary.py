@@ -0,0 +1,275 @@
+"""
+Correction of tracks with stops
+
+While the vehicle is standing consecutive fixes differ only by GNSS
+jitter, and the angle between them is noise. Fixes of a stop (see
+`stationary_mask`) keep the angle of the last moving fix instead: the
+recurrence runs over the moving fixes only, the angles of the stops are
+filled in and the shifts applied with array operations. A long idle
+period costs a few array operations rather than a pass of the loop
+per fix.
+"""
+from math import atan2, cos, sin, nan
+from typing import TYPE_CHECKING
+
+import numpy as np
+from src.data.make_dataset import DataSet, ColumnarDataSet
+from src.data.preprocess import (INPUT_COLUMNS,
+                                 STOP_SPEED,
+                                 STOP_STEP,
+                                 stationary_mask)
+from src.functions.profile import VehicleProfile
+from src.functions.scalar import HALF_PI
+from src.functions.shift_table import ShiftTable
+from src.functions.vectorized import (adjust,
+                                      as_column,
+                                      column_shifts,
+                                      recalc_first,
+                                      store_columns)
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+def hold_forward_kernel(x: list,
+                        y: list,
+                        roll: list,
+                        shift_x: list,
+                        shift_y: list,
+                        backroll: list,
+                        moving: list,
+                        angle_x: list) -> int:
+    """
+    `forward_kernel` over the moving points of a whole track. Points
+    between them keep the angle of the last moving point, so the first
+    point after a stop is unrolled against the last point of the stop
+    adjusted with that angle. Points of stops never anchor the track.
+
+    Parameters
+    ----------
+    x, y, roll, shift_x, shift_y, backroll: list
+        Columns of all points, see `forward_kernel`
+
+    moving: list
+        Ascending indices of the moving points, starting with 0 and 1
+
+    angle_x: list
+        Angles between x and x', filled in place for the moving points
+
+    Returns
+    ----------
+    anchor: int
+        Index of the first moving point with the same roll as the
+        previous point, -1 if there is none
+    """
+
+    flag, anchor, last = True, -1, -1
+    x_adj = y_adj = alpha = nan
+
+    for i in moving:
+        if i == 0:
+            alpha = nan
+        elif i == 1:
+            alpha = atan2(y[1] - y[0], x[1] - x[0])
+            # Zero point gets the same angle
+            angle_x[0] = alpha
+        else:
+            p = i - 1
+            if p != last:
+                # Last point of the stop adjusted with the held angle
+                alpha_y = alpha + HALF_PI
+                x_adj = (x[p] + cos(alpha) * shift_x[p]
+                         + cos(alpha_y) * shift_y[p])
+                y_adj = (y[p] + sin(alpha) * shift_x[p]
+                         + sin(alpha_y) * shift_y[p])
+            if flag and roll[i] == roll[p]:
+                # Correct angle between two points with same roll
+                alpha = atan2(y[i] - y[p], x[i] - x[p])
+                flag = False
+                anchor = i
+            else:
+                # Unroll adjusted previous point by the roll of current one
+                alpha_y = alpha + HALF_PI
+                x_back = x_adj + cos(alpha_y) * backroll[i]
+                y_back = y_adj + sin(alpha_y) * backroll[i]
+                alpha = atan2(y[i] - y_back, x[i] - x_back)
+        angle_x[i] = alpha
+
+        alpha_y = alpha + HALF_PI
+        x_adj = x[i] + cos(alpha) * shift_x[i] + cos(alpha_y) * shift_y[i]
+        y_adj = y[i] + sin(alpha) * shift_x[i] + sin(alpha_y) * shift_y[i]
+        last = i
+
+    return anchor
+
+
+def hold_backward_kernel(x: list,
+                         y: list,
+                         shift_x: list,
+                         shift_y: list,
+                         backroll: list,
+                         moving: list,
+                         angle_x: list,
+                         anchor: int,
+                         first: int = 0) -> None:
+    """
+    `backward_kernel` over the moving points between `first` and
+    `anchor` given in descending order. Points of a stop keep the angle
+    passed back from the point after the stop
+
+    Parameters
+    ----------
+    moving: list
+        Descending indices of the moving points with
+        first < index < anchor
+    """
+
+    alpha = angle_x[anchor]
+
+    for j in moving:
+        angle_x[j] = alpha
+        cos_x, sin_x = cos(alpha), sin(alpha)
+        cos_y, sin_y = cos(alpha + HALF_PI), sin(alpha + HALF_PI)
+        # Adjusted point with the correct angle
+        x_adj = x[j] + cos_x * shift_x[j] + cos_y * shift_y[j]
+        y_adj = y[j] + sin_x * shift_x[j] + sin_y * shift_y[j]
+        # Rollback to the roll of previous point
+        x_adj = x_adj + cos_y * backroll[j-1]
+        y_adj = y_adj + sin_y * backroll[j-1]
+        alpha = atan2(y_adj - y[j-1], x_adj - x[j-1])
+
+    if anchor > first:
+        angle_x[first] = alpha
+
+
+def hold_angles(angle_x: np.ndarray, source: np.ndarray) -> np.ndarray:
+    """
+    Gives every point the angle of the last point marked in `source`
+    at or before it (the first point must be marked)
+    """
+
+    index = np.where(source, np.arange(len(source)), 0)
+    return angle_x[np.maximum.accumulate(index)]
+
+
+def transfrom_arrays_stationary(time_s,
+                                x_mm,
+                                y_mm,
+                                roll_deg,
+                                pitch_deg,
+                                recalc: bool = True,
+                                recalc_window: int | None = None,
+                                stationary: np.ndarray | None = None,
+                                min_step: float = STOP_STEP,
+                                min_speed: float = STOP_SPEED,
+                                shift_table: ShiftTable | None = None,
+                                profile: VehicleProfile | None = None
+                                ) -> dict[str, np.ndarray]:
+    """
+    Version of `transfrom_arrays` for a track with stops: fixes of
+    the stops hold the angle of the last moving fix (see the module).
+    Without stops the result is identical to `transfrom_arrays`
+
+    Parameters
+    ----------
+    time_s, x_mm, y_mm, roll_deg, pitch_deg: array-like
+        Columns of the initial data
+
+    recalc: bool, default = True
+        recalculate previous points' coordinates after
+        encountering points with the same roll
+
+    recalc_window: int, optional
+        Number of previous points to recalculate. All points by default
+
+    stationary: np.ndarray, optional
+        Mask of the fixes of stops, `stationary_mask` with `min_step`
+        and `min_speed` by default. The first two fixes are always moving
+
+    min_step, min_speed: float
+        Thresholds of `stationary_mask`
+
+    shift_table: ShiftTable, optional
+        Lookup table for shifts of quantized roll and pitch
+
+    profile: VehicleProfile, optional
+        Installation geometry of GNSS module
+
+    Returns
+    ----------
+    columns: dict[str, np.ndarray]
+        Initial columns, calculated angle_x, angle_y, shift_x, shift_y,
+        adj_x, adj_y and the mask `stationary`
+    """
+
+    columns = {'time_s': as_column(time_s),
+               'x_mm': as_column(x_mm),
+               'y_mm': as_column(y_mm),
+               'roll_deg': as_column(roll_deg),
+               'pitch_deg': as_column(pitch_deg)}
+    if stationary is None:
+        stationary = stationary_mask(columns['time_s'], columns['x_mm'],
+                                     columns['y_mm'], min_step, min_speed)
+    else:
+        stationary = np.asarray(stationary, dtype=bool).copy()
+        stationary[:2] = False
+    shift_x, shift_y = column_shifts(columns['roll_deg'],
+                                     columns['pitch_deg'],
+                                     shift_table, profile)
+    columns['shift_x'], columns['shift_y'] = shift_x, shift_y
+
+    x, y, roll, sx, sy, back = (column.tolist() for column in
+                                (columns['x_mm'], columns['y_mm'],
+                                 columns['roll_deg'], shift_x, shift_y,
+                                 -shift_y))
+    moving = np.flatnonzero(~stationary)
+    angles = [nan] * len(x)
+    anchor = hold_forward_kernel(x, y, roll, sx, sy, back, moving.tolist(),
+                                 angles)
+
+    source = ~stationary
+    if recalc and anchor > 0:
+        first = recalc_first(anchor, recalc_window)
+        between = moving[(moving > first) & (moving < anchor)]
+        hold_backward_kernel(x, y, sx, sy, back, between[::-1].tolist(),
+                             angles, anchor, first)
+        source[first] = True
+
+    columns['angle_x'] = np.array(angles, dtype=np.float64)
+    if len(source):
+        columns['angle_x'] = hold_angles(columns['angle_x'], source)
+    adjust(columns)
+    columns['stationary'] = stationary
+
+    return columns
+
+
+def transfrom_stationary(df: 'pd.DataFrame',
+                         dataset: DataSet | ColumnarDataSet,
+                         recalc: bool = True,
+                         recalc_window: int | None = None,
+                         min_step: float = STOP_STEP,
+                         min_speed: float = STOP_SPEED,
+                         profile: VehicleProfile | None = None
+                         ) -> np.ndarray:
+    """
+    Version of `transfrom_batch` which holds the heading during stops,
+    see `transfrom_arrays_stationary`
+
+    Returns
+    ----------
+    stationary: np.ndarray
+        Mask of the fixes of stops
+    """
+
+    columns = transfrom_arrays_stationary(*(df[name]
+                                            for name in INPUT_COLUMNS),
+                                          recalc=recalc,
+                                          recalc_window=recalc_window,
+                                          min_step=min_step,
+                                          min_speed=min_speed,
+                                          profile=profile)
+    stationary = columns.pop('stationary')
+    store_columns(columns, dataset)
+
+    return stationary
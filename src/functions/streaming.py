@@ -0,0 +1,321 @@
+from collections import deque
+from dataclasses import dataclass
+from math import atan2, nan
+from typing import Callable, NamedTuple
+
+from src.functions.scalar import (HALF_PI,
+                                  caluclate_shifts,
+                                  apply_shifts,
+                                  rotate_and_shift,
+                                  unroll)
+
+
+class CorrectedFix(NamedTuple):
+    """
+    Single point corrected on the fly
+
+    Attributes
+    ---------
+    time_s, x_mm, y_mm, roll_deg, pitch_deg: float
+        Values of the received fix
+
+    angle_x, angle_y: float
+        Angles between x and x', y'. NaN for the very first fix
+
+    shift_x, shift_y: float
+        Shifts along x' and y' axes
+
+    adj_x, adj_y: float
+        Corrected coordinates. NaN for the very first fix
+    """
+
+    time_s: float
+    x_mm: float
+    y_mm: float
+    roll_deg: float
+    pitch_deg: float
+    angle_x: float
+    angle_y: float
+    shift_x: float
+    shift_y: float
+    adj_x: float
+    adj_y: float
+
+
+@dataclass
+class CorrectorState:
+    """
+    Everything the corrector needs to know about the past
+
+    Attributes
+    ---------
+    count: int
+        Number of fixes received
+
+    time_s, x_mm, y_mm, roll_deg, pitch_deg: float
+        Values of the last fix
+
+    shift_x, shift_y: float
+        Shifts of the last fix
+
+    angle_x: float
+        Angle between x and x' of the last fix
+
+    adj_x, adj_y: float
+        Corrected coordinates of the last fix
+
+    flag: bool
+        flag = True if the points with the same roll have not yet
+        been encountered, False otherwise
+
+    anchor: int
+        Index of the first fix with the same roll as the previous one,
+        -1 if it has not been encountered yet
+    """
+
+    count: int = 0
+    time_s: float = nan
+    x_mm: float = nan
+    y_mm: float = nan
+    roll_deg: float = nan
+    pitch_deg: float = nan
+    shift_x: float = nan
+    shift_y: float = nan
+    angle_x: float = nan
+    adj_x: float = nan
+    adj_y: float = nan
+    flag: bool = True
+    anchor: int = -1
+
+
+class StreamingCorrector:
+    """
+    Corrects fixes one at a time as they are received. Keeps only the last
+    fix in its state, so memory does not grow with the length of the feed.
+
+    Every fix is emitted immediately. Corrections of earlier fixes
+    (the zero fix once the first one arrives and, with `lookback`,
+    the fixes before the first pair with the same roll) are delivered
+    to the subscribers as retroactive corrections. The recalculation pass
+    is spread over the following fixes, at most `recalc_budget` fixes
+    per push, so the live path is never blocked by it.
+
+    Methods
+    ----------
+    push(time_s: float,
+         x_mm: float,
+         y_mm: float,
+         roll_deg: float,
+         pitch_deg: float,
+         shift: tuple[float, float] | None = None) -> CorrectedFix
+        Corrects a new fix
+
+    subscribe(callback: Callable[[int, CorrectedFix], None])
+        Registers receiver of retroactive corrections
+
+    flush()
+        Finishes pending recalculation pass
+    """
+
+    __slots__ = ('height', 'state', 'recalc_budget', 'shift_table',
+                 'profile', '_history', '_pending', '_subscribers')
+
+    def __init__(self,
+                 height: float = 1500,
+                 state: CorrectorState | None = None,
+                 lookback: int = 0,
+                 recalc_budget: int | None = None,
+                 shift_table=None,
+                 profile=None) -> None:
+        """
+        Parameters
+        ----------
+        height: float
+            Height of GNSS module installation in mm.
+
+        state: CorrectorState, optional
+            State to continue from, e.g. saved from another corrector
+
+        lookback: int, default = 0
+            Number of previous fixes recalculated when the first pair of
+            fixes with the same roll is encountered
+
+        recalc_budget: int, optional
+            Maximal number of fixes recalculated per push.
+            The whole pass is made at once by default
+
+        shift_table: ShiftTable, optional
+            Lookup table for shifts of quantized roll and pitch.
+            Its height is used instead of `height`
+
+        profile: VehicleProfile, optional
+            Installation geometry of GNSS module on the vehicle.
+            Used instead of `height` and `shift_table`
+        """
+
+        self.height = height
+        self.state = CorrectorState() if state is None else state
+        self.recalc_budget = recalc_budget
+        self.shift_table = shift_table
+        self.profile = profile
+        if shift_table is not None:
+            self.height = shift_table.height
+        if profile is not None:
+            self.height = profile.height
+        self._history = deque(maxlen=lookback) if lookback > 0 else None
+        self._pending = None
+        self._subscribers = []
+
+    def subscribe(self,
+                  callback: Callable[[int, CorrectedFix], None]) -> None:
+        """
+        Registers receiver of retroactive corrections. It is called with
+        the index of corrected fix and its new CorrectedFix
+
+        Parameters
+        ----------
+        callback: Callable[[int, CorrectedFix], None]
+            Receiver of corrections
+        """
+
+        self._subscribers.append(callback)
+
+    def _emit(self, index: int, point: tuple, alpha: float) -> CorrectedFix:
+        """
+        Corrects stored point with the given angle and sends it
+        to the subscribers
+        """
+
+        time_s, x_mm, y_mm, roll_deg, pitch_deg, shift_x, shift_y = point
+        alpha_y = alpha + HALF_PI
+        adj_x, adj_y = apply_shifts(x_mm, y_mm, alpha, alpha_y,
+                                    shift_x, shift_y)
+        fix = CorrectedFix(time_s, x_mm, y_mm, roll_deg, pitch_deg,
+                           alpha, alpha_y, shift_x, shift_y, adj_x, adj_y)
+        for callback in self._subscribers:
+            callback(index, fix)
+        return fix
+
+    def _recalc(self, budget: int | None) -> None:
+        """
+        Makes up to `budget` steps of pending recalculation pass
+        (see `recalc_prev_elements`)
+        """
+
+        points, index, alpha = self._pending
+        steps = len(points) if budget is None else budget
+
+        while points and steps > 0:
+            fix = self._emit(index, points.pop(), alpha)
+            index -= 1
+            steps -= 1
+            if points:
+                # Rollback to the roll of previous point
+                prev = points[-1]
+                x_adj, y_adj = unroll(fix.adj_x, fix.adj_y, alpha, prev[6])
+                alpha = atan2(y_adj - prev[2], x_adj - prev[1])
+
+        self._pending = (points, index, alpha) if points else None
+
+    def flush(self) -> None:
+        """
+        Finishes pending recalculation pass
+        """
+
+        if self._pending is not None:
+            self._recalc(None)
+
+    def push(self,
+             time_s: float,
+             x_mm: float,
+             y_mm: float,
+             roll_deg: float,
+             pitch_deg: float,
+             shift: tuple[float, float] | None = None) -> CorrectedFix:
+        """
+        Corrects a new fix using the state left by the previous one
+
+        Parameters
+        ----------
+        time_s: float
+            Timestamp
+
+        x_mm, y_mm: float
+            Coordinates
+
+        roll_deg, pitch_deg: float
+            Degrees of roll and pitch
+
+        shift: tuple[float, float], optional
+            Shifts of the fix calculated beforehand, e.g. for a batch
+            of fixes at once
+
+        Returns
+        ----------
+        fix: CorrectedFix
+            Corrected fix
+        """
+
+        if self._pending is not None:
+            self._recalc(self.recalc_budget)
+
+        state = self.state
+        time_s, x_mm, y_mm = float(time_s), float(x_mm), float(y_mm)
+        roll_deg, pitch_deg = float(roll_deg), float(pitch_deg)
+
+        if shift is not None:
+            shift_x, shift_y = shift
+        elif self.profile is not None:
+            shift_x, shift_y = self.profile.shift(roll_deg, pitch_deg)
+        elif self.shift_table is None:
+            shift_x, shift_y = caluclate_shifts(roll_deg, pitch_deg,
+                                                self.height)
+        else:
+            shift_x, shift_y = self.shift_table.shift(roll_deg, pitch_deg)
+
+        history = self._history
+        anchor = False
+
+        if state.count == 0:
+            x_prev = y_prev = nan
+        elif state.count == 1 or (state.flag
+                                  and roll_deg == state.roll_deg):
+            # Angle between raw points
+            x_prev, y_prev = state.x_mm, state.y_mm
+        else:
+            # Unroll previous adjusted point by the roll of current one
+            x_prev, y_prev = unroll(state.adj_x, state.adj_y,
+                                    state.angle_x, shift_y)
+
+        alpha, alpha_y, adj_x, adj_y = rotate_and_shift(x_prev, y_prev,
+                                                        x_mm, y_mm,
+                                                        shift_x, shift_y)
+
+        if state.count == 1:
+            # Zero fix gets the same angle
+            self._emit(0, (state.time_s, state.x_mm, state.y_mm,
+                           state.roll_deg, state.pitch_deg,
+                           state.shift_x, state.shift_y), alpha)
+        elif state.flag and state.count > 1 and roll_deg == state.roll_deg:
+            # Points with the same roll give the correct angle
+            state.flag = False
+            state.anchor = state.count
+            anchor = history is not None
+
+        if anchor:
+            # Recalculate previous points starting from this angle
+            self._pending = (list(history), state.count - 1, alpha)
+            self._history = None
+            self._recalc(self.recalc_budget)
+        elif history is not None and state.flag:
+            history.append((time_s, x_mm, y_mm, roll_deg, pitch_deg,
+                            shift_x, shift_y))
+
+        state.count += 1
+        state.time_s, state.x_mm, state.y_mm = time_s, x_mm, y_mm
+        state.roll_deg, state.pitch_deg = roll_deg, pitch_deg
+        state.shift_x, state.shift_y = shift_x, shift_y
+        state.angle_x, state.adj_x, state.adj_y = alpha, adj_x, adj_y
+
+        return CorrectedFix(time_s, x_mm, y_mm, roll_deg, pitch_deg,
+                            alpha, alpha_y, shift_x, shift_y, adj_x, adj_y)
@@ -0,0 +1,419 @@
+from math import atan2, cos, sin, nan
+from typing import TYPE_CHECKING, Mapping
+
+import numpy as np
+from src.data.make_dataset import DataSet, ColumnarDataSet
+from src.functions.functions import caluclate_shifts, apply_shifts
+from src.functions.profile import VehicleProfile, fleet_shifts
+from src.functions.scalar import HALF_PI
+from src.functions.shift_table import ShiftTable
+from src.functions.streaming import CorrectorState
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Maximal absolute difference (mm for coordinates, radians for angles)
+# between the batch engine and the per-row path of `transfrom`
+BATCH_TOLERANCE = 1e-6
+
+
+def as_column(values) -> np.ndarray:
+    """
+    Converts a sequence into contiguous float64 array without copying
+    if it is already one
+    """
+
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+
+def forward_kernel(x: list,
+                   y: list,
+                   roll: list,
+                   shift_x: list,
+                   shift_y: list,
+                   backroll: list,
+                   angle_x: list,
+                   state: CorrectorState) -> None:
+    """
+    Sequential part of the correction: calculates rotation angles
+    of the points one after another. Each angle depends on the previous
+    adjusted point, hence this recurrence can not be vectorized.
+
+    Parameters
+    ----------
+    x, y: list
+        Coordinates of the points
+
+    roll: list
+        Degrees of roll
+
+    shift_x, shift_y: list
+        Shifts along the axes of local reference frame
+
+    backroll: list
+        Backward shifts along y-axis of local reference frame
+
+    angle_x: list
+        Angles between x and x', filled in place
+
+    state: CorrectorState
+        State left by the previous points, updated in place.
+        Only count, x_mm, y_mm, roll_deg, shift_x, shift_y, angle_x,
+        adj_x, adj_y, flag and anchor are used
+    """
+
+    count, flag, anchor = state.count, state.flag, state.anchor
+    x_prev, y_prev, roll_prev = state.x_mm, state.y_mm, state.roll_deg
+    x_adj, y_adj, alpha = state.adj_x, state.adj_y, state.angle_x
+
+    for i in range(len(x)):
+        if count == 0:
+            alpha = nan
+        elif count == 1:
+            alpha = atan2(y[i] - y_prev, x[i] - x_prev)
+            # Zero point gets the same angle
+            if i > 0:
+                angle_x[i-1] = alpha
+        elif flag and roll[i] == roll_prev:
+            # Correct angle between two points with same roll
+            alpha = atan2(y[i] - y_prev, x[i] - x_prev)
+            flag = False
+            anchor = count
+        else:
+            # Unroll adjusted previous point by the roll of current one
+            alpha_y = alpha + HALF_PI
+            x_back = x_adj + cos(alpha_y) * backroll[i]
+            y_back = y_adj + sin(alpha_y) * backroll[i]
+            alpha = atan2(y[i] - y_back, x[i] - x_back)
+        angle_x[i] = alpha
+
+        alpha_y = alpha + HALF_PI
+        x_adj = x[i] + cos(alpha) * shift_x[i] + cos(alpha_y) * shift_y[i]
+        y_adj = y[i] + sin(alpha) * shift_x[i] + sin(alpha_y) * shift_y[i]
+        x_prev, y_prev, roll_prev = x[i], y[i], roll[i]
+        count += 1
+
+    if x:
+        state.count, state.flag, state.anchor = count, flag, anchor
+        state.x_mm, state.y_mm, state.roll_deg = x_prev, y_prev, roll_prev
+        state.shift_x, state.shift_y = shift_x[-1], shift_y[-1]
+        state.adj_x, state.adj_y, state.angle_x = x_adj, y_adj, alpha
+
+
+def backward_kernel(x: list,
+                    y: list,
+                    shift_x: list,
+                    shift_y: list,
+                    backroll: list,
+                    angle_x: list,
+                    anchor: int,
+                    first: int = 0) -> None:
+    """
+    Recalculates angles of the points from `first` to `anchor`
+    applying the algorithm backwards (see `recalc_prev_elements`)
+
+    Parameters
+    ----------
+    x, y: list
+        Coordinates of the points
+
+    shift_x, shift_y: list
+        Shifts along the axes of local reference frame
+
+    backroll: list
+        Backward shifts along y-axis of local reference frame
+
+    angle_x: list
+        Angles between x and x', updated in place
+
+    anchor: int
+        Index of the first point with the same roll as the previous one
+
+    first: int, default = 0
+        Index of the earliest point to recalculate
+    """
+
+    alpha = angle_x[anchor]
+
+    for j in range(anchor - 1, first - 1, -1):
+        angle_x[j] = alpha
+        if j == first:
+            break
+        cos_x, sin_x = cos(alpha), sin(alpha)
+        cos_y, sin_y = cos(alpha + HALF_PI), sin(alpha + HALF_PI)
+        # Adjusted point with the correct angle
+        x_adj = x[j] + cos_x * shift_x[j] + cos_y * shift_y[j]
+        y_adj = y[j] + sin_x * shift_x[j] + sin_y * shift_y[j]
+        # Rollback to the roll of previous point
+        x_adj = x_adj + cos_y * backroll[j-1]
+        y_adj = y_adj + sin_y * backroll[j-1]
+        alpha = atan2(y_adj - y[j-1], x_adj - x[j-1])
+
+
+def recalc_first(anchor: int, window: int | None) -> int:
+    """
+    Returns index of the earliest point recalculated from the anchor
+    """
+
+    return 0 if window is None else max(0, anchor - window)
+
+
+def column_shifts(roll_deg: np.ndarray,
+                  pitch_deg: np.ndarray,
+                  shift_table: ShiftTable | None = None,
+                  profile: VehicleProfile | Mapping | None = None,
+                  vehicle_id: np.ndarray | None = None
+                  ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Calculates shifts of the fixes for a single profile or,
+    with `vehicle_id`, for a mapping of profiles of several vehicles
+    """
+
+    if isinstance(profile, Mapping):
+        if vehicle_id is None:
+            raise ValueError('vehicle_id is required for several profiles')
+        return fleet_shifts(roll_deg, pitch_deg, vehicle_id, profile)
+    if profile is not None:
+        return profile.shifts(roll_deg, pitch_deg)
+    if shift_table is not None:
+        return shift_table.shifts(roll_deg, pitch_deg)
+    return caluclate_shifts(roll_deg, pitch_deg)
+
+
+def track_order(vehicle_id) -> tuple[np.ndarray, list[int], list]:
+    """
+    Groups rows by vehicle keeping their order inside each vehicle
+
+    Returns
+    ----------
+    order: np.ndarray
+        Indices of the rows sorted by vehicle
+
+    bounds: list[int]
+        Start of rows of every vehicle in `order` and the end
+
+    ids: list
+        Vehicle of every group
+    """
+
+    ids, inverse = np.unique(np.asarray(vehicle_id), return_inverse=True)
+    inverse = inverse.ravel()
+    order = np.argsort(inverse, kind='stable')
+    counts = np.bincount(inverse, minlength=len(ids))
+    bounds = np.concatenate([[0], np.cumsum(counts)]).tolist()
+    return order, bounds, ids.tolist()
+
+
+def track_angles(x: list,
+                 y: list,
+                 roll: list,
+                 shift_x: list,
+                 shift_y: list,
+                 backroll: list,
+                 state: CorrectorState,
+                 recalc: bool = True,
+                 recalc_window: int | None = None) -> list:
+    """
+    Calculates angles between x and x' of the points of a single
+    vehicle continuing from the state, see `forward_kernel`
+    and `backward_kernel`
+    """
+
+    offset = state.count
+    angles = [nan] * len(x)
+    forward_kernel(x, y, roll, shift_x, shift_y, backroll, angles, state)
+
+    anchor = state.anchor - offset
+    if recalc and anchor > 0:
+        first = recalc_first(state.anchor, recalc_window)
+        backward_kernel(x, y, shift_x, shift_y, backroll, angles, anchor,
+                        max(first - offset, 0))
+
+    return angles
+
+
+def adjust(columns: dict[str, np.ndarray]) -> None:
+    """
+    Calculates angle_y, adj_x and adj_y of the columns from angle_x.
+    Points without angle keep their coordinates as adj_x = adj_y = 0
+    like in the per-row path
+    """
+
+    columns['angle_y'] = columns['angle_x'] + np.deg2rad(90)
+    adj_x, adj_y = apply_shifts(columns['x_mm'], columns['y_mm'],
+                                columns['angle_x'], columns['angle_y'],
+                                columns['shift_x'], columns['shift_y'])
+    undefined = np.isnan(columns['angle_x'])
+    adj_x[undefined] = 0
+    adj_y[undefined] = 0
+    columns['adj_x'], columns['adj_y'] = adj_x, adj_y
+
+
+def transfrom_arrays(time_s,
+                     x_mm,
+                     y_mm,
+                     roll_deg,
+                     pitch_deg,
+                     recalc: bool = True,
+                     recalc_window: int | None = None,
+                     state: CorrectorState | dict | None = None,
+                     shift_table: ShiftTable | None = None,
+                     profile: VehicleProfile | Mapping | None = None,
+                     vehicle_id=None) -> dict[str, np.ndarray]:
+    """
+    Batch version of `transfrom` working on whole columns at once.
+    Shifts and adjusted coordinates are calculated with array operations,
+    only the recurrence for rotation angles is calculated in a loop.
+
+    Results match the per-row path within BATCH_TOLERANCE.
+
+    Parameters
+    ----------
+    time_s, x_mm, y_mm, roll_deg, pitch_deg: array-like
+        Columns of the initial data
+
+    recalc: bool, default = True
+        recalculate previous points' coordinates after
+        encountering points with the same roll
+
+    recalc_window: int, optional
+        Number of previous points to recalculate. All points by default
+
+    state: CorrectorState, optional
+        State left by the previous part of the track, updated in place.
+        With the state only the points of these columns are recalculated.
+        With `vehicle_id` a dict of states of the vehicles
+
+    shift_table: ShiftTable, optional
+        Lookup table for shifts of quantized roll and pitch
+
+    profile: VehicleProfile or Mapping[Hashable, VehicleProfile], optional
+        Installation geometry of GNSS module. With `vehicle_id`
+        a mapping of profiles of the vehicles
+
+    vehicle_id: array-like, optional
+        Vehicle of each fix. Fixes of every vehicle are corrected as
+        a separate track, the results keep the order of the rows
+
+    Returns
+    ----------
+    columns: dict[str, np.ndarray]
+        Initial columns and calculated angle_x, angle_y, shift_x, shift_y,
+        adj_x, adj_y. If there is only one point its angles are NaN and
+        adjusted coordinates are 0 as in the per-row path.
+    """
+
+    columns = {'time_s': as_column(time_s),
+               'x_mm': as_column(x_mm),
+               'y_mm': as_column(y_mm),
+               'roll_deg': as_column(roll_deg),
+               'pitch_deg': as_column(pitch_deg)}
+    shift_x, shift_y = column_shifts(columns['roll_deg'],
+                                     columns['pitch_deg'],
+                                     shift_table, profile, vehicle_id)
+    columns['shift_x'], columns['shift_y'] = shift_x, shift_y
+    backroll = -shift_y
+
+    if vehicle_id is None:
+        state = CorrectorState() if state is None else state
+        angles = track_angles(columns['x_mm'].tolist(),
+                              columns['y_mm'].tolist(),
+                              columns['roll_deg'].tolist(),
+                              shift_x.tolist(), shift_y.tolist(),
+                              backroll.tolist(), state,
+                              recalc, recalc_window)
+        columns['angle_x'] = np.array(angles, dtype=np.float64)
+        tracks = [(state, len(angles) - 1)] if angles else []
+    else:
+        states = {} if state is None else state
+        order, bounds, ids = track_order(vehicle_id)
+        x, y, roll, sx, sy, back = (
+            column[order].tolist() for column in
+            (columns['x_mm'], columns['y_mm'], columns['roll_deg'],
+             shift_x, shift_y, backroll))
+        angles, tracks = [], []
+        for vehicle, a, b in zip(ids, bounds, bounds[1:]):
+            track_state = states.setdefault(vehicle, CorrectorState())
+            angles.extend(track_angles(x[a:b], y[a:b], roll[a:b], sx[a:b],
+                                       sy[a:b], back[a:b], track_state,
+                                       recalc, recalc_window))
+            tracks.append((track_state, order[b-1]))
+        columns['angle_x'] = np.empty(len(angles), dtype=np.float64)
+        columns['angle_x'][order] = angles
+
+    adjust(columns)
+    for track_state, last in tracks:
+        track_state.time_s = float(columns['time_s'][last])
+        track_state.pitch_deg = float(columns['pitch_deg'][last])
+
+    return columns
+
+
+def transfrom_batch(df: 'pd.DataFrame',
+                    dataset: DataSet | ColumnarDataSet,
+                    recalc: bool = True,
+                    recalc_window: int | None = None,
+                    profile: VehicleProfile | Mapping | None = None,
+                    vehicle_column: str | None = None) -> None:
+    """
+    Batch replacement for `transfrom`: corrects the whole DataFrame
+    at once and stores the results in the dataset
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Initial pandas DataFrame
+
+    dataset: DataSet or ColumnarDataSet
+        Instance of class DataSet where the data will be stored
+
+    recalc: bool, default = True
+        recalculate previous points' coordinates after
+        encountering points with the same roll
+
+    recalc_window: int, optional
+        Number of previous points to recalculate. All points by default
+
+    profile: VehicleProfile or Mapping[Hashable, VehicleProfile], optional
+        Installation geometry of GNSS module, a mapping of profiles
+        of the vehicles with `vehicle_column`
+
+    vehicle_column: str, optional
+        Column with vehicle IDs for logs of several vehicles
+    """
+
+    columns = transfrom_arrays(df['time_s'],
+                               df['x_mm'],
+                               df['y_mm'],
+                               df['roll_deg'],
+                               df['pitch_deg'],
+                               recalc=recalc,
+                               recalc_window=recalc_window,
+                               profile=profile,
+                               vehicle_id=(None if vehicle_column is None
+                                           else df[vehicle_column]))
+    store_columns(columns, dataset)
+
+
+def store_columns(columns: dict[str, np.ndarray],
+                  dataset: DataSet | ColumnarDataSet) -> None:
+    """
+    Appends corrected columns to the dataset
+    """
+
+    if isinstance(dataset, ColumnarDataSet):
+        dataset.extend_columns(columns)
+        return
+
+    for name in ['time_s', 'x_mm', 'y_mm', 'roll_deg', 'pitch_deg',
+                 'adj_x', 'adj_y']:
+        getattr(dataset, name).extend(columns[name].tolist())
+
+    n = len(columns['time_s'])
+    if n > 1:
+        dataset.angle.extend(zip(columns['angle_x'].tolist(),
+                                 columns['angle_y'].tolist()))
+    else:
+        dataset.angle.extend([()] * n)
+    dataset.shift.extend(zip(columns['shift_x'].tolist(),
+                             columns['shift_y'].tolist()))
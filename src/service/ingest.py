@@ -0,0 +1,423 @@
+"""
+Asyncio ingestion of live GNSS feeds from many vehicles
+
+Lines 'vehicle_id,time_s,x_mm,y_mm,roll_deg,pitch_deg' are read from
+sockets, pipes or any async iterable, corrected in batches with the
+states of all vehicles kept as arrays (see FleetCorrector) and sent to
+an async consumer. The points equal those of a StreamingCorrector per
+vehicle up to rounding in the last bits, see src.functions.fleet.
+
+Load test with data/data.csv replayed by 1000 vehicles at 5 Hz:
+    python -m src.service.ingest data/data.csv --vehicles 1000 --rate 5
+"""
+import argparse
+import asyncio
+import logging
+import time
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Mapping
+
+import numpy as np
+from src.functions.fleet import FleetCorrector
+from src.functions.profile import VehicleProfile
+from src.functions.streaming import CorrectedFix, StreamingCorrector
+
+logger = logging.getLogger(__name__)
+
+Fix = tuple[float, float, float, float, float]
+# Vehicle ID, index of the fix in the vehicle's feed and corrected fix.
+# Retroactive corrections come with indices of earlier fixes
+Point = tuple[str, int, CorrectedFix]
+
+
+def parse_line(line: str) -> tuple[str, Fix]:
+    """
+    Parses line 'vehicle_id,time_s,x_mm,y_mm,roll_deg,pitch_deg'
+    """
+
+    vehicle_id, *values = line.strip().split(',')
+    time_s, x_mm, y_mm, roll_deg, pitch_deg = map(float, values)
+    return vehicle_id, (time_s, x_mm, y_mm, roll_deg, pitch_deg)
+
+
+class IngestService:
+    """
+    Corrects fixes of many vehicles received concurrently.
+
+    Fixes are put into a bounded queue, so producers wait when
+    the corrector can not keep up (backpressure). The consumer task
+    takes all queued fixes up to `batch_size` at once and corrects them
+    with a FleetCorrector: shifts of all fixes and every epoch of all
+    vehicles are calculated with array operations. With `lookback`
+    each vehicle has its own StreamingCorrector instead, which
+    recalculates earlier fixes. Corrected points of the batch, including
+    retroactive corrections, are awaited by the consumer in one call.
+
+    Methods
+    ----------
+    put(vehicle_id: str, fix: Fix)
+        Queues a fix, waits while the queue is full
+
+    put_line(line: str)
+        Queues a csv line
+
+    feed(lines: AsyncIterable[str])
+        Queues all lines of an async iterable
+
+    read_stream(reader: asyncio.StreamReader)
+        Queues lines read from a socket or a pipe
+
+    serve(host: str, port: int) -> asyncio.Server
+        Accepts feeds over TCP
+
+    run()
+        Corrects queued fixes until cancelled
+
+    join()
+        Waits until all queued fixes are corrected
+
+    flush()
+        Finishes pending recalculation passes of all vehicles
+    """
+
+    def __init__(self,
+                 consumer: Callable[[list[Point]], Awaitable[None]],
+                 height: float = 1500,
+                 maxsize: int = 10_000,
+                 batch_size: int = 1024,
+                 lookback: int = 0,
+                 recalc_budget: int | None = None,
+                 profiles: Mapping[str, VehicleProfile] | None = None
+                 ) -> None:
+        """
+        Parameters
+        ----------
+        consumer: async Callable[[list[Point]], None]
+            Receiver of corrected points
+
+        height: float
+            Height of GNSS module installation in mm for vehicles
+            without profile
+
+        maxsize: int, default = 10000
+            Maximal number of queued fixes
+
+        batch_size: int, default = 1024
+            Maximal number of fixes corrected at once
+
+        lookback, recalc_budget: int, optional
+            See StreamingCorrector. With lookback > 0 the vehicles
+            are corrected one by one
+
+        profiles: Mapping[str, VehicleProfile], optional
+            Installation geometry of GNSS module on the vehicles
+        """
+
+        self.consumer = consumer
+        self.fleet = FleetCorrector(height, profiles)
+        self.default = self.fleet.default
+        self.profiles = self.fleet.profiles
+        self.batch_size = batch_size
+        self.lookback = lookback
+        self.recalc_budget = recalc_budget
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.correctors: dict[str, StreamingCorrector] = {}
+        self.rejected = 0
+        self.failed = 0
+        self._output: list[Point] = []
+
+    def corrector(self, vehicle_id: str) -> StreamingCorrector:
+        """
+        Returns corrector of the vehicle, creates it for a new vehicle
+        """
+
+        corrector = self.correctors.get(vehicle_id)
+        if corrector is None:
+            corrector = StreamingCorrector(lookback=self.lookback,
+                                           recalc_budget=self.recalc_budget,
+                                           profile=self.profile(vehicle_id))
+            corrector.subscribe(lambda index, fix: self._output.append(
+                (vehicle_id, index, fix)))
+            self.correctors[vehicle_id] = corrector
+        return corrector
+
+    def profile(self, vehicle_id: str) -> VehicleProfile:
+        return self.fleet.profile(vehicle_id)
+
+    @property
+    def vehicles(self) -> int:
+        return len(self.fleet) + len(self.correctors)
+
+    @property
+    def fixes(self) -> int:
+        """
+        Number of corrected fixes
+        """
+
+        state = self.fleet.state
+        return (int(state.count[:len(state)].sum())
+                + sum(c.state.count for c in self.correctors.values()))
+
+    async def put(self, vehicle_id: str, fix: Fix) -> None:
+        await self.queue.put((vehicle_id, fix))
+
+    async def put_line(self, line: str) -> None:
+        """
+        Queues a csv line. Empty lines and headers are skipped,
+        malformed lines are counted in `rejected`
+        """
+
+        if not line.strip() or line.startswith('vehicle_id'):
+            return
+        try:
+            vehicle_id, fix = parse_line(line)
+        except ValueError:
+            self.rejected += 1
+            return
+        await self.put(vehicle_id, fix)
+
+    async def feed(self, lines: AsyncIterable[str]) -> None:
+        async for line in lines:
+            await self.put_line(line)
+
+    async def read_stream(self, reader: asyncio.StreamReader) -> None:
+        """
+        Queues lines until the end of the stream
+        """
+
+        async for line in reader:
+            await self.put_line(line.decode())
+
+    async def read_pipe(self, pipe) -> None:
+        """
+        Queues lines read from a pipe (file object), e.g. sys.stdin
+        """
+
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), pipe)
+        try:
+            await self.read_stream(reader)
+        finally:
+            transport.close()
+
+    async def serve(self,
+                    host: str = '127.0.0.1',
+                    port: int = 8765) -> asyncio.Server:
+        """
+        Starts TCP server, each connection is a feed of lines
+        """
+
+        async def handle(reader: asyncio.StreamReader,
+                         writer: asyncio.StreamWriter) -> None:
+            try:
+                await self.read_stream(reader)
+            finally:
+                writer.close()
+
+        return await asyncio.start_server(handle, host, port)
+
+    def process(self, batch: list[tuple[str, Fix]]) -> list[Point]:
+        """
+        Corrects a batch of fixes of any vehicles
+        """
+
+        ids = [vehicle_id for vehicle_id, _ in batch]
+        values = np.array([fix for _, fix in batch],
+                          dtype=np.float64).reshape(-1, 5).T
+        if self.lookback <= 0:
+            return self.process_fleet(ids, values)
+
+        # The whole batch is converted before any corrector is advanced,
+        # so a malformed fix fails the batch without touching the states
+        shift_x, shift_y = self.fleet.shifts(ids, values[3], values[4])
+        fixes = zip(*values.tolist(), shift_x.tolist(), shift_y.tolist())
+        correctors = [self.corrector(vehicle_id) for vehicle_id in ids]
+        try:
+            for vehicle_id, corrector, fix in zip(ids, correctors, fixes):
+                index = corrector.state.count
+                self._output.append((vehicle_id, index,
+                                     corrector.push(*fix[:5],
+                                                    shift=fix[5:])))
+        finally:
+            # Points of a failed batch are dropped with it, not sent
+            # with the next one
+            output, self._output = self._output, []
+
+        return output
+
+    def process_fleet(self, ids: list[str], values: np.ndarray) -> list[Point]:
+        """
+        Corrects a batch with the FleetCorrector, a zero fix corrected
+        again comes right before the fix which corrected it
+        """
+
+        columns, zero = self.fleet.correct(ids, *values)
+        fixes = map(CorrectedFix._make,
+                    zip(*(columns[name].tolist()
+                          for name in CorrectedFix._fields)))
+        output = list(zip(ids, columns['index'].tolist(), fixes))
+
+        rows = zero['row'].tolist()
+        if rows:
+            zero_fixes = map(CorrectedFix._make,
+                             zip(*(zero[name].tolist()
+                                   for name in CorrectedFix._fields)))
+            # Inserted from the end, so the rows after it keep their places
+            for row, fix in sorted(zip(rows, zero_fixes), reverse=True):
+                output.insert(row, (ids[row], 0, fix))
+
+        return output
+
+    async def run(self) -> None:
+        """
+        Corrects queued fixes until cancelled. A batch which fails
+        in the corrector or in the consumer is logged and counted
+        in `failed`, the service goes on with the next one
+        """
+
+        queue = self.queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                await self.consumer(self.process(batch))
+            except Exception:
+                self.failed += len(batch)
+                logger.exception('Batch of %d fixes failed', len(batch))
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def join(self) -> None:
+        await self.queue.join()
+
+    async def flush(self) -> None:
+        """
+        Finishes pending recalculation passes of all vehicles
+        and sends the corrections to the consumer
+        """
+
+        for corrector in self.correctors.values():
+            corrector.flush()
+        output, self._output = self._output, []
+        if output:
+            await self.consumer(output)
+
+
+async def replay_csv(path: str,
+                     vehicles: int = 1,
+                     rate: float | None = None,
+                     repeat: int = 1) -> AsyncIterator[str]:
+    """
+    Replays a log as feeds of several vehicles 'vehicle-0', 'vehicle-1'...
+    Local stand-in of live feeds for load testing
+
+    Parameters
+    ----------
+    path: str
+        Log in the format of data/data.csv
+
+    vehicles: int, default = 1
+        Number of vehicles sending the same log
+
+    rate: float, optional
+        Fixes per second of each vehicle. As fast as possible by default
+
+    repeat: int, default = 1
+        Number of times the log is sent. Time of every repeat
+        continues the previous one
+
+    Yields
+    ----------
+    line: str
+        Line 'vehicle_id,time_s,x_mm,y_mm,roll_deg,pitch_deg'
+    """
+
+    with open(path) as file:
+        rows = [list(map(float, line.split(',')))
+                for line in file.read().splitlines()[1:] if line]
+    duration = rows[-1][0] - rows[0][0] if rows else 0.0
+    names = [f'vehicle-{v}' for v in range(vehicles)]
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    tick = 0
+
+    for k in range(repeat):
+        for time_s, *values in rows:
+            if rate is not None:
+                delay = start + tick / rate - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tick += 1
+            line = ','.join(map(repr, [time_s + k * duration, *values]))
+            for name in names:
+                yield f'{name},{line}'
+        if rate is None:
+            # Let the consumer run between repeats
+            await asyncio.sleep(0)
+
+
+async def load_test(path: str,
+                    vehicles: int,
+                    rate: float | None,
+                    repeat: int,
+                    maxsize: int,
+                    batch_size: int) -> dict:
+    """
+    Replays the log through the service and measures throughput
+    """
+
+    points = 0
+
+    async def consumer(batch: list[Point]) -> None:
+        nonlocal points
+        points += len(batch)
+
+    service = IngestService(consumer, maxsize=maxsize,
+                            batch_size=batch_size)
+    worker = asyncio.create_task(service.run())
+    start = time.perf_counter()
+
+    await service.feed(replay_csv(path, vehicles, rate, repeat))
+    await service.join()
+    await service.flush()
+    worker.cancel()
+
+    seconds = time.perf_counter() - start
+    fixes = service.fixes
+    return {'vehicles': service.vehicles,
+            'fixes': fixes,
+            'points': points,
+            'rejected': service.rejected,
+            'failed': service.failed,
+            'seconds': seconds,
+            'fixes_per_s': fixes / max(seconds, 1e-9)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('path', help='log to replay')
+    parser.add_argument('--vehicles', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=None,
+                        help='fixes per second of each vehicle')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--maxsize', type=int, default=10_000,
+                        help='maximal number of queued fixes')
+    parser.add_argument('--batch-size', type=int, default=1024)
+    args = parser.parse_args()
+
+    result = asyncio.run(load_test(args.path, args.vehicles, args.rate,
+                                   args.repeat, args.maxsize,
+                                   args.batch_size))
+    print(f'{result["vehicles"]} vehicles, {result["fixes"]} fixes '
+          f'in {result["seconds"]:.3f} s '
+          f'({result["fixes_per_s"]:,.0f} fixes/s), '
+          f'{result["rejected"]} rejected, {result["failed"]} failed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import numpy as np
+
+
+def pixel_size(ax) -> tuple[int, int]:
+    """
+    Returns width and height of the axes in pixels
+    """
+
+    bbox = ax.get_window_extent()
+    return max(int(bbox.width), 1), max(int(bbox.height), 1)
+
+
+def lttb(x, y, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling of a time series.
+    Keeps the first and the last points and from every bucket
+    the point forming the largest triangle with the point kept
+    in the previous bucket and the average of the next bucket,
+    so peaks survive the downsampling
+
+    Parameters
+    ----------
+    x, y: array-like
+        Time series
+
+    n_out: int
+        Number of points to keep
+
+    Returns
+    ----------
+    indices: np.ndarray
+        Sorted indices of kept points
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    edges = np.append(edges, n)
+    indices = np.empty(n_out, dtype=np.intp)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i+1]
+        next_x = x[stop:edges[i+2]].mean()
+        next_y = y[stop:edges[i+2]].mean()
+        area = np.abs((x[a] - next_x) * (y[start:stop] - y[a])
+                      - (x[a] - x[start:stop]) * (next_y - y[a]))
+        a = start + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+        indices[i+1] = a
+
+    return indices
+
+
+def grid_sample(x,
+                y,
+                xlim: tuple[float, float],
+                ylim: tuple[float, float],
+                bins: tuple[int, int]) -> np.ndarray:
+    """
+    Keeps the first point in every cell of a regular grid over
+    the limits, e.g. one point per pixel. Points outside the limits
+    are dropped
+
+    Parameters
+    ----------
+    x, y: array-like
+        Coordinates of the points
+
+    xlim, ylim: tuple[float, float]
+        Limits of the grid
+
+    bins: tuple[int, int]
+        Number of cells along x and y
+
+    Returns
+    ----------
+    indices: np.ndarray
+        Sorted indices of kept points
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    (x0, x1), (y0, y1) = sorted(xlim), sorted(ylim)
+    inside = np.flatnonzero((x >= x0) & (x <= x1) & (y >= y0) & (y <= y1))
+
+    bins_x, bins_y = max(int(bins[0]), 1), max(int(bins[1]), 1)
+    cell_x = ((x[inside] - x0) / max(x1 - x0, 1e-12) * bins_x).astype(int)
+    cell_y = ((y[inside] - y0) / max(y1 - y0, 1e-12) * bins_y).astype(int)
+    cells = (np.minimum(cell_y, bins_y - 1) * bins_x
+             + np.minimum(cell_x, bins_x - 1))
+
+    first = np.unique(cells, return_index=True)[1]
+    return np.sort(inside[first])
+
+
+def spread(indices: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Keeps at most `n_out` of the indices evenly spread over them
+    """
+
+    if len(indices) <= n_out:
+        return indices
+    return indices[np.linspace(0, len(indices) - 1, n_out).astype(int)]
@@ -0,0 +1,191 @@
+"""
+Headless rendering of QA figures for many logs
+
+Every log is corrected and its figures `EDA`, `post_plot_1` and
+`post_plot_2` are written as PNG/SVG files by worker processes with
+the non-interactive Agg backend. Each worker draws all its logs into
+the same figure templates instead of creating new figures.
+matplotlib and pandas are imported by the functions which use them.
+"""
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from src.data.make_dataset import (ColumnarDataSet,
+                                   extract_angles,
+                                   make_new_df)
+from src.functions.vectorized import transfrom_batch
+from src.visualization.visualize import (EDA,
+                                         make_template,
+                                         post_plot_1,
+                                         post_plot_2)
+
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+
+FIGURES = ('EDA', 'post_plot_1', 'post_plot_2')
+FORMATS = ('png', 'svg')
+
+# Templates of the current process, see `template`
+_templates: dict[str, 'Figure'] = {}
+
+
+def template(name: str) -> 'Figure':
+    """
+    Returns figure template of the current process for the function
+    `name`, creates it on the first call
+    """
+
+    fig = _templates.get(name)
+    if fig is None:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        fig = make_template(name)
+        FigureCanvasAgg(fig)
+        _templates[name] = fig
+    return fig
+
+
+def init_worker() -> None:
+    """
+    Switches worker process to the non-interactive backend
+    """
+
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def save_figure(fig: 'Figure', path: Path, dpi: int) -> None:
+    """
+    Writes figure, the file appears only when it is completely written
+    """
+
+    tmp_path = path.with_name(f'.{path.name}.tmp')
+    fig.savefig(tmp_path, dpi=dpi, format=path.suffix[1:])
+    os.replace(tmp_path, path)
+
+
+def render_log(path: Path,
+               out_dir: Path,
+               formats: tuple[str, ...] = ('png',),
+               dpi: int = 100,
+               recalc: bool = True,
+               recalc_window: int | None = None,
+               smoothing: int | None = None) -> dict:
+    """
+    Corrects a log and writes its figures to
+    out_dir/<log name>_<figure>.<format>
+
+    Parameters
+    ----------
+    path: Path
+        Initial log
+
+    out_dir: Path
+        Directory for the figures
+
+    formats: tuple[str, ...], default = ('png',)
+        Formats of the files, any of FORMATS
+
+    dpi: int, default = 100
+        Resolution of raster formats
+
+    recalc, recalc_window: optional
+        See `transfrom_batch`
+
+    smoothing: int, optional
+        Window of moving average for headings, see `post_plot_2`
+
+    Returns
+    ----------
+    timings: dict
+        Number of fixes, seconds of correction and, per figure,
+        seconds of drawing and of writing each format
+    """
+
+    import pandas as pd
+
+    start = time.perf_counter()
+    df = pd.read_csv(path)
+    dataset = ColumnarDataSet()
+    transfrom_batch(df, dataset, recalc=recalc, recalc_window=recalc_window)
+    df_new = make_new_df(dataset)
+    df['timedelta'] = df['time_s'] - df['time_s'].shift(1)
+    timings = {'path': str(path),
+               'fixes': len(df),
+               'correct_s': time.perf_counter() - start,
+               'figures': {}}
+
+    index = dataset.spatial_index()
+    draw = {'EDA': lambda fig: EDA(df, fig=fig),
+            'post_plot_1': lambda fig: post_plot_1(df_new, index=index,
+                                                   fig=fig),
+            'post_plot_2': lambda fig: post_plot_2(
+                df_new, extract_angles(dataset), smoothing, index=index,
+                headings=dataset.kinematics(smoothing).heading, fig=fig)}
+
+    for name in FIGURES:
+        fig = template(name)
+        start = time.perf_counter()
+        draw[name](fig)
+        figure = {'draw_s': time.perf_counter() - start}
+        for fmt in formats:
+            start = time.perf_counter()
+            save_figure(fig, out_dir / f'{path.stem}_{name}.{fmt}', dpi)
+            figure[f'{fmt}_s'] = time.perf_counter() - start
+        timings['figures'][name] = figure
+
+    return timings
+
+
+def generate_report(paths: list[Path],
+                    out_dir: Path,
+                    formats: tuple[str, ...] = ('png',),
+                    dpi: int = 100,
+                    workers: int | None = None,
+                    recalc: bool = True,
+                    recalc_window: int | None = None,
+                    smoothing: int | None = None) -> list[dict]:
+    """
+    Renders figures of the logs in a process pool and writes timings
+    of all logs to out_dir/report.json
+
+    Parameters
+    ----------
+    paths: list[Path]
+        Initial logs
+
+    out_dir: Path
+        Directory for the figures
+
+    workers: int, optional
+        Number of processes. os.cpu_count() by default
+
+    formats, dpi, recalc, recalc_window, smoothing: optional
+        See `render_log`
+
+    Returns
+    ----------
+    timings: list[dict]
+        Timings of the logs in the order of `paths`
+    """
+
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise ValueError(f'Unsupported formats {sorted(unknown)}')
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    n = len(paths)
+    tasks = (paths, [out_dir] * n, [tuple(formats)] * n, [dpi] * n,
+             [recalc] * n, [recalc_window] * n, [smoothing] * n)
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=init_worker) as pool:
+        timings = list(pool.map(render_log, *tasks))
+
+    with open(out_dir / 'report.json', 'w') as file:
+        json.dump(timings, file, indent=2)
+
+    return timings
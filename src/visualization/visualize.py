@@ -1,6 +1,34 @@
-import matplotlib.pyplot as plt
+from typing import TYPE_CHECKING
+
 import numpy as np
-import pandas as pd
+from src.data.kinematics import track_kinematics
+from src.data.spatial import GridIndex
+from src.visualization.downsample import (grid_sample,
+                                          lttb,
+                                          pixel_size,
+                                          spread)
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from matplotlib.figure import Figure
+
+# Default numbers of arrows and text labels drawn on a track panel
+MAX_ARROWS = 2500
+MAX_LABELS = 100
+# Margin around the points and side of the zoomed panel relative
+# to the side of the limits fitted to the track
+MARGIN = 0.15
+ZOOM = 0.25
+# Sizes of arrows and offsets of labels are given for a panel of this
+# side in mm (the sample track) and scaled with the side of the limits
+SIDE = 3950
+
+# Grids of axes (rows, columns) and sizes of the figures
+LAYOUTS = {'EDA': (2, 2, (12, 10)),
+           'post_plot_1': (3, 2, (12, 12)),
+           'post_plot_2': (2, 1, (8, 12))}
+
+BBox = tuple[float, float, float, float]
 
 
 def plot_0() -> None:
@@ -8,6 +36,8 @@ def plot_0() -> None:
     Creates initial plot illustrating different reference frames
     """
 
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots(figsize=(5, 5))
 
     ax.arrow(1.6, 1.4, -0.2, 0.2, width=0.01, color='black')
@@ -26,7 +56,179 @@ def plot_0() -> None:
     ax.set_xlabel('y')
 
 
-def EDA(df: pd.DataFrame) -> None:
+def make_template(name: str) -> 'Figure':
+    """
+    Creates an empty figure with the axes of one of LAYOUTS without
+    pyplot, so it is not shown and can be drawn to again and again
+    by the function `name`, e.g. `post_plot_1(df_new, fig=template)`
+    """
+
+    from matplotlib.figure import Figure
+
+    nrows, ncols, figsize = LAYOUTS[name]
+    fig = Figure(figsize=figsize)
+    fig.subplots(nrows, ncols)
+    return fig
+
+
+def figure_axes(name: str, fig: 'Figure | None' = None):
+    """
+    Returns figure and axes for the function `name` as `plt.subplots`.
+    Axes of a given template are cleared and reused, otherwise a new
+    pyplot figure is created
+    """
+
+    nrows, ncols, figsize = LAYOUTS[name]
+    if fig is None:
+        import matplotlib.pyplot as plt
+        return plt.subplots(nrows, ncols, figsize=figsize)
+
+    for ax in fig.axes:
+        ax.cla()
+    ax = np.array(fig.axes, dtype=object).reshape(nrows, ncols)
+    return fig, ax.ravel() if 1 in (nrows, ncols) else ax
+
+
+def plot_series(ax, values, rows: np.ndarray | None = None,
+                **kwargs) -> None:
+    """
+    Plots values against their index downsampled by LTTB
+    to about two points per pixel of the axes width.
+    Only `rows` are plotted if given
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    rows = np.arange(len(values)) if rows is None else rows
+    index = rows[lttb(rows, values[rows], 2 * pixel_size(ax)[0])]
+    ax.plot(index, values[index], **kwargs)
+
+
+def fit_limits(x,
+               y,
+               margin: float = MARGIN
+               ) -> tuple[tuple[float, float], tuple[float, float]]:
+    """
+    Returns square limits around the points with a margin relative
+    to the larger side, so the track is not distorted
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if not np.isfinite(x).any() or not np.isfinite(y).any():
+        return (0.0, 1.0), (0.0, 1.0)
+
+    x0, x1, y0, y1 = np.nanmin(x), np.nanmax(x), np.nanmin(y), np.nanmax(y)
+    half = max(x1 - x0, y1 - y0, 1.0) * (1 + 2 * margin) / 2
+    center_x, center_y = (x0 + x1) / 2, (y0 + y1) / 2
+    return ((center_x - half, center_x + half),
+            (center_y - half, center_y + half))
+
+
+def track_view(index: GridIndex,
+               bbox: BBox | None = None,
+               time_window: tuple[float, float] | None = None
+               ) -> tuple[np.ndarray, tuple[float, float],
+                          tuple[float, float]]:
+    """
+    Queries points of the track inside the bounding box
+    (x_min, x_max, y_min, y_max) and the time window
+
+    Returns
+    ----------
+    rows: np.ndarray
+        Sorted indices of the points
+
+    xlim, ylim: tuple[float, float]
+        Limits of the bounding box or fitted to the points
+    """
+
+    rows = index.query(bbox, time_window)
+    if bbox is not None:
+        return rows, bbox[:2], bbox[2:]
+    xlim, ylim = fit_limits(index.x[rows], index.y[rows])
+    return rows, xlim, ylim
+
+
+def zoom_box(x, y, xlim: tuple[float, float], ylim: tuple[float, float],
+             zoom: float = ZOOM) -> BBox:
+    """
+    Returns bounding box of `zoom` of the limits centered
+    on the middle one of the points
+    """
+
+    half_x = (xlim[1] - xlim[0]) * zoom / 2
+    half_y = (ylim[1] - ylim[0]) * zoom / 2
+    if len(x) == 0:
+        center_x, center_y = sum(xlim) / 2, sum(ylim) / 2
+    else:
+        center_x, center_y = x[len(x) // 2], y[len(y) // 2]
+    return (center_x - half_x, center_x + half_x,
+            center_y - half_y, center_y + half_y)
+
+
+def scatter_points(ax,
+                   x,
+                   y,
+                   xlim: tuple[float, float] | None = None,
+                   ylim: tuple[float, float] | None = None,
+                   **kwargs) -> None:
+    """
+    Scatters at most one point per pixel of the axes inside the limits
+    (extent of the points by default)
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    xlim = (np.nanmin(x), np.nanmax(x)) if xlim is None else xlim
+    ylim = (np.nanmin(y), np.nanmax(y)) if ylim is None else ylim
+    shown = grid_sample(x, y, xlim, ylim, pixel_size(ax))
+    ax.scatter(x[shown], y[shown], **kwargs)
+
+
+def arrow_indices(x,
+                  y,
+                  xlim: tuple[float, float],
+                  ylim: tuple[float, float],
+                  max_arrows: int = MAX_ARROWS) -> np.ndarray:
+    """
+    Selects at most `max_arrows` points inside the limits,
+    one per cell of a square grid
+    """
+
+    side = max(int(np.sqrt(max_arrows)), 1)
+    return grid_sample(x, y, xlim, ylim, (side, side))
+
+
+def draw_arrows(ax,
+                x: np.ndarray,
+                y: np.ndarray,
+                dx: np.ndarray,
+                dy: np.ndarray,
+                width: float,
+                head_width: float,
+                head_length: float | None = None,
+                facecolor: str = 'C0',
+                edgecolor: str = 'black') -> None:
+    """
+    Draws arrows with one quiver looking as `ax.arrow` with the same
+    sizes in data units (head is added to the length of the arrow)
+    """
+
+    head_length = 1.5 * head_width if head_length is None else head_length
+    length = np.hypot(dx, dy)
+    scale = (length + head_length) / np.where(length > 0, length, np.inf)
+    ax.quiver(x, y, dx * scale, dy * scale,
+              angles='xy', scale_units='xy', scale=1, units='xy',
+              width=width,
+              headwidth=head_width / width,
+              headlength=head_length / width,
+              headaxislength=head_length / width,
+              facecolor=facecolor,
+              edgecolor=edgecolor,
+              linewidth=1)
+
+
+def EDA(df: 'pd.DataFrame', fig: 'Figure | None' = None) -> 'Figure':
     """
     Creates exploratory data analysis visualisation
 
@@ -34,15 +236,24 @@ def EDA(df: pd.DataFrame) -> None:
     ----------
     df: pd.Dataframe
         Initial DataFrame
+
+    fig: Figure, optional
+        Template made by `make_template('EDA')` to draw into
+
+    Returns
+    ----------
+    fig: Figure
+        Figure with the visualisation
     """
 
-    fig, ax = plt.subplots(2, 2, figsize=(12, 10))
+    fig, ax = figure_axes('EDA', fig)
 
     # Position
-    ax[0][0].scatter(df.x_mm,
-                     df.y_mm,
-                     s=20,
-                     c='orangered')
+    scatter_points(ax[0][0],
+                   df.x_mm,
+                   df.y_mm,
+                   s=20,
+                   c='orangered')
     ax[0][0].plot(df.iloc[[0, -1]]['x_mm'],
                   df.iloc[[0, -1]]['y_mm'],
                   linewidth=1)
@@ -51,7 +262,7 @@ def EDA(df: pd.DataFrame) -> None:
     ax[0][0].set_ylabel('y')
 
     # Update frequency
-    ax[0][1].plot(df.timedelta)
+    plot_series(ax[0][1], df.timedelta)
     ax[0][1].hlines(df.timedelta.mean(),
                     xmin=0,
                     xmax=df.shape[0],
@@ -62,7 +273,7 @@ def EDA(df: pd.DataFrame) -> None:
     ax[0][1].set_xlabel('Timestamp')
 
     # Roll
-    ax[1][0].plot(df.roll_deg)
+    plot_series(ax[1][0], df.roll_deg)
     ax[1][0].set_title('Roll')
     ax[1][0].set_ylabel('Degrees')
     ax[1][0].set_xlabel('Timestamp')
@@ -73,7 +284,7 @@ def EDA(df: pd.DataFrame) -> None:
                     colors=['orangered'])
 
     # Pitch
-    ax[1][1].plot(df.pitch_deg)
+    plot_series(ax[1][1], df.pitch_deg)
     ax[1][1].set_title('Pitch')
     ax[1][1].set_ylabel('Degrees')
     ax[1][1].set_xlabel('Timestamp')
@@ -85,113 +296,198 @@ def EDA(df: pd.DataFrame) -> None:
 
     fig.tight_layout()
 
+    return fig
+
+
+def shift_columns(df_new: 'pd.DataFrame') -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns shifts along x- and y-axis from dataframe made by `make_new_df`
+    with either numeric or legacy tuple columns
+    """
+
+    if 'shift_x' in df_new:
+        return df_new['shift_x'].to_numpy(), df_new['shift_y'].to_numpy()
+
+    shifts = np.array(df_new['shift'].tolist(), dtype=np.float64)
+    return shifts[:, 0], shifts[:, 1]
 
-def post_plot_1(df_new: pd.DataFrame) -> None:
+
+def track_index(df_new: 'pd.DataFrame') -> GridIndex:
+    """
+    Builds spatial index of the corrected points of dataframe made
+    by `make_new_df`. Build it once to pass to `post_plot_1` and
+    `post_plot_2` when viewing several regions of a long track
     """
-    Creates visualization for the first task
+
+    return GridIndex(df_new.adj_x.to_numpy(), df_new.adj_y.to_numpy(),
+                     df_new.time_s.to_numpy())
+
+
+def post_plot_1(df_new: 'pd.DataFrame',
+                max_arrows: int = MAX_ARROWS,
+                max_labels: int = MAX_LABELS,
+                bbox: BBox | None = None,
+                time_window: tuple[float, float] | None = None,
+                zoom: BBox | None = None,
+                index: GridIndex | None = None,
+                fig: 'Figure | None' = None) -> 'Figure':
+    """
+    Creates visualization for the first task.
+    Points are decimated to the resolution of the axes, so the time
+    of rendering does not grow with the length of the track. Only
+    points inside the bounding box and the time window are fetched
+    from the spatial index
 
     Prameters
     ----------
     df_new: pd.DataFrame
         Dataframe with recalculated values
+
+    max_arrows: int, default = MAX_ARROWS
+        Maximal number of correction arrows per panel
+
+    max_labels: int, default = MAX_LABELS
+        Maximal number of pitch and roll labels
+
+    bbox: tuple[float, float, float, float], optional
+        Region (x_min, x_max, y_min, y_max) of the track.
+        Limits are fitted to the points by default
+
+    time_window: tuple[float, float], optional
+        Interval of timestamps to show, also limits time series
+
+    zoom: tuple[float, float, float, float], optional
+        Region of the zoomed panel. By default ZOOM of the region
+        around the middle point
+
+    index: GridIndex, optional
+        Spatial index of corrected points, see `track_index`
+
+    fig: Figure, optional
+        Template made by `make_template('post_plot_1')` to draw into
+
+    Returns
+    ----------
+    fig: Figure
+        Figure with the visualization
     """
 
-    fig, ax = plt.subplots(3, 2, figsize=(12, 12))
+    index = track_index(df_new) if index is None else index
+
+    fig, ax = figure_axes('post_plot_1', fig)
 
     ax = ax.ravel()  # type: ignore
 
+    x_mm, y_mm = df_new.x_mm.to_numpy(), df_new.y_mm.to_numpy()
+    adj_x, adj_y = df_new.adj_x.to_numpy(), df_new.adj_y.to_numpy()
+    pitch, roll = df_new.pitch_deg.to_numpy(), df_new.roll_deg.to_numpy()
+
     # ax 0
-    ax[0].scatter(df_new.x_mm,
-                  df_new.y_mm,
-                  s=10)
-    ax[0].scatter(df_new.adj_x,
-                  df_new.adj_y,
-                  c='r',
-                  s=10)
-
-    for i in range(len(df_new.time_s)):
-        ax[0].arrow(df_new.x_mm[i],
-                    df_new.y_mm[i],
-                    (df_new.adj_x[i]-df_new.x_mm[i]),
-                    (df_new.adj_y[i]-df_new.y_mm[i]),
-                    width=10,
-                    head_width=30)
-
-    for i in range(len(df_new)):
-        ax[0].text(df_new.iloc[i]['x_mm'] + 30,
-                   df_new.iloc[i]['y_mm'],
-                   f"pitch: {df_new.iloc[i]['pitch_deg']}, roll: {df_new.iloc[i]['roll_deg']}", fontsize=7)
-
-    ax[0].set_xlim([6250, 10200])
-    ax[0].set_ylim([-35700, -31750])
+    rows, xlim, ylim = track_view(index, bbox, time_window)
+    ax[0].set_xlim(xlim)
+    ax[0].set_ylim(ylim)
+    scatter_points(ax[0], x_mm[rows], y_mm[rows], xlim, ylim, s=10)
+    scatter_points(ax[0], adj_x[rows], adj_y[rows], xlim, ylim,
+                   c='r', s=10)
+
+    arrows = rows[arrow_indices(x_mm[rows], y_mm[rows], xlim, ylim,
+                                max_arrows)]
+    scale = (xlim[1] - xlim[0]) / SIDE
+    draw_arrows(ax[0],
+                x_mm[arrows],
+                y_mm[arrows],
+                adj_x[arrows] - x_mm[arrows],
+                adj_y[arrows] - y_mm[arrows],
+                width=10*scale,
+                head_width=30*scale)
+
+    for i in spread(arrows, max_labels):
+        ax[0].text(x_mm[i] + 30*scale,
+                   y_mm[i],
+                   f"pitch: {pitch[i]}, roll: {roll[i]}", fontsize=7)
+
     ax[0].set_title('Correction')
     ax[0].set_xlabel('x')
     ax[0].set_ylabel('y')
 
     # ax 1
-    ax[1].scatter(df_new.x_mm,
-                  df_new.y_mm,
-                  s=30)
-    ax[1].scatter(df_new.adj_x,
-                  df_new.adj_y,
-                  c='r',
-                  s=30)
-    ax[1].plot(df_new.iloc[[0, -1]].x_mm,
-               df_new.iloc[[0, -1]].y_mm,
+    if zoom is None:
+        zoom = zoom_box(adj_x[rows], adj_y[rows], xlim, ylim)
+    rows, xlim, ylim = track_view(index, zoom, time_window)
+    ax[1].set_xlim(xlim)
+    ax[1].set_ylim(ylim)
+    scatter_points(ax[1], x_mm[rows], y_mm[rows], xlim, ylim, s=30)
+    scatter_points(ax[1], adj_x[rows], adj_y[rows], xlim, ylim,
+                   c='r', s=30)
+    ends = rows[[0, -1]] if len(rows) else rows
+    ax[1].plot(x_mm[ends],
+               y_mm[ends],
                c='orangered',
                linewidth=1)
-    ax[1].plot(df_new.iloc[[0, -1]].adj_x,
-               df_new.iloc[[0, -1]].adj_y,
+    ax[1].plot(adj_x[ends],
+               adj_y[ends],
                c='royalblue',
                linewidth=1)
 
-    for i in range(len(df_new.time_s)):
-        ax[1].arrow(df_new.x_mm[i],
-                    df_new.y_mm[i],
-                    (df_new.adj_x[i]-df_new.x_mm[i]),
-                    (df_new.adj_y[i]-df_new.y_mm[i]),
-                    width=5,
-                    head_width=10)
+    arrows = rows[arrow_indices(x_mm[rows], y_mm[rows], xlim, ylim,
+                                max_arrows)]
+    scale = (xlim[1] - xlim[0]) / (SIDE * ZOOM)
+    draw_arrows(ax[1],
+                x_mm[arrows],
+                y_mm[arrows],
+                adj_x[arrows] - x_mm[arrows],
+                adj_y[arrows] - y_mm[arrows],
+                width=5*scale,
+                head_width=10*scale)
 
-    ax[1].set_xlim([8500, 9500])
-    ax[1].set_ylim([-35000, -34000])
     ax[1].set_title('Correction zoomed')
     ax[1].set_xlabel('x')
     ax[1].set_ylabel('y')
 
     # ax 2 - 5
-    x_shift = []
-    y_shift = []
-    for i in range(len(df_new)):
-        x_shift.append(df_new['shift'][i][0])
-        y_shift.append(df_new['shift'][i][1])
+    x_shift, y_shift = shift_columns(df_new)
+    rows = None if time_window is None else index.window(*time_window)
 
-    ax[2].plot(x_shift)
+    plot_series(ax[2], x_shift, rows)
     ax[2].set_title('Shift along x-axis')
     ax[2].set_xlabel('Timestamp')
     ax[2].set_xlabel('mm')
 
-    ax[3].plot(df_new['pitch_deg'])
+    plot_series(ax[3], df_new['pitch_deg'], rows)
     ax[3].set_title('Pitch')
     ax[3].set_xlabel('Timestamp')
     ax[3].set_xlabel('Degrees')
 
-    ax[4].plot(y_shift)
+    plot_series(ax[4], y_shift, rows)
     ax[4].set_title('Shift along y-axis')
     ax[4].set_xlabel('Timestamp')
     ax[4].set_xlabel('mm')
 
-    ax[5].plot(df_new['roll_deg'])
+    plot_series(ax[5], df_new['roll_deg'], rows)
     ax[5].set_title('Roll')
     ax[5].set_xlabel('Timestamp')
     ax[5].set_xlabel('Degrees')
 
     fig.tight_layout()
 
+    return fig
+
 
-def post_plot_2(df_new: pd.DataFrame, angles: list[float]) -> None:
+def post_plot_2(df_new: 'pd.DataFrame',
+                angles: list[float],
+                smoothing: int | None = None,
+                max_arrows: int = MAX_ARROWS,
+                bbox: BBox | None = None,
+                time_window: tuple[float, float] | None = None,
+                index: GridIndex | None = None,
+                headings: np.ndarray | None = None,
+                fig: 'Figure | None' = None) -> 'Figure':
     """
-    Creates visualization for the second task
+    Creates visualization for the second task.
+    Points are decimated to the resolution of the axes, so the time
+    of rendering does not grow with the length of the track. Only
+    points inside the bounding box and the time window are fetched
+    from the spatial index
 
     Patameters
     ----------
@@ -200,42 +496,75 @@ def post_plot_2(df_new: pd.DataFrame, angles: list[float]) -> None:
 
     angles: list[float]
         Angles between x and x'
+
+    smoothing: int, optional
+        Window of moving average applied to the track for headings
+
+    max_arrows: int, default = MAX_ARROWS
+        Maximal number of heading arrows
+
+    bbox: tuple[float, float, float, float], optional
+        Region (x_min, x_max, y_min, y_max) of the track.
+        Limits are fitted to the points by default
+
+    time_window: tuple[float, float], optional
+        Interval of timestamps to show, also limits the angles
+
+    index: GridIndex, optional
+        Spatial index of corrected points, see `track_index`
+
+    headings: np.ndarray, optional
+        Precalculated headings of the track in radians,
+        e.g. cached `ColumnarDataSet.kinematics`
+
+    fig: Figure, optional
+        Template made by `make_template('post_plot_2')` to draw into
+
+    Returns
+    ----------
+    fig: Figure
+        Figure with the visualization
     """
 
-    x_mm = df_new.adj_x
-    y_mm = df_new.adj_y
+    index = track_index(df_new) if index is None else index
+    x_mm = df_new.adj_x.to_numpy()
+    y_mm = df_new.adj_y.to_numpy()
     # calculate headings
-    dx = np.diff(x_mm)
-    dy = np.diff(y_mm)
-    headings = np.arctan2(dy, dx)
+    if headings is None:
+        headings = track_kinematics(df_new.time_s, x_mm, y_mm,
+                                    smoothing).heading
     # plot points and headings as lines with arrows
-    fig, ax = plt.subplots(2, 1, figsize=(8, 12))
-    ax[0].scatter(x_mm, y_mm, c='orangered', s=30)
-    for i in range(len(headings)):
-        x_start = x_mm[i]
-        y_start = y_mm[i]
-        x_end = x_start + 50*np.cos(headings[i])
-        y_end = y_start + 50*np.sin(headings[i])
-        ax[0].arrow(x_start,
-                    y_start,
-                    x_end-x_start,
-                    y_end-y_start,
-                    head_width=50,
-                    head_length=50,
-                    width=10,
-                    fc='royalblue',
-                    ec='royalblue')
-
-    ax[0].set_xlim(6250, 10200)
-    ax[0].set_ylim(-35700, -31750)
+    fig, ax = figure_axes('post_plot_2', fig)
+    rows, xlim, ylim = track_view(index, bbox, time_window)
+    ax[0].set_xlim(xlim)
+    ax[0].set_ylim(ylim)
+    scatter_points(ax[0], x_mm[rows], y_mm[rows], xlim, ylim,
+                   c='orangered', s=30)
+
+    arrows = rows[arrow_indices(x_mm[rows], y_mm[rows], xlim, ylim,
+                                max_arrows)]
+    scale = (xlim[1] - xlim[0]) / SIDE
+    draw_arrows(ax[0],
+                x_mm[arrows],
+                y_mm[arrows],
+                50*scale*np.cos(headings[arrows]),
+                50*scale*np.sin(headings[arrows]),
+                width=10*scale,
+                head_width=50*scale,
+                head_length=50*scale,
+                facecolor='royalblue',
+                edgecolor='royalblue')
 
     ax[0].set_title('Vehicle heading')
     ax[0].set_xlabel('x')
     ax[0].set_ylabel('y')
 
-    ax[1].plot(angles)
+    rows = None if time_window is None else index.window(*time_window)
+    plot_series(ax[1], angles, rows)
     ax[1].set_title("Vehicle heading (angle between $x$ and $x'$)")
     ax[1].set_xlabel('Timestamp')
     ax[1].set_ylabel('Angle(degrees)')
 
     fig.tight_layout()
+
+    return fig